@@ -0,0 +1,92 @@
+"""Broadcast latency vs room size.
+
+Run from the repository root:
+
+    python -m bench.fanout [--latency 0.002] [--stall]
+
+Every fake member takes `--latency` seconds to accept a frame. The time
+reported is from handing a frame to the room until the last healthy member
+has received it. With `--stall` one member never completes its send, which
+must not move the numbers.
+"""
+import argparse
+import asyncio
+import time
+
+from src.session.broadcast import MemberOutbound
+from src.session.frame import Frame
+
+ROOM_SIZES = (2, 10, 50, 100, 250, 500)
+
+
+class FakeSocket:
+    def __init__(self, latency: float, stalled: bool = False):
+        self.latency = latency
+        self.stalled = stalled
+        self.received = asyncio.Event()
+
+    async def send_text(self, text: str):
+        if self.stalled:
+            await asyncio.Event().wait()
+        await asyncio.sleep(self.latency)
+        self.received.set()
+
+    async def close(self, code=1000, reason=None):
+        pass
+
+
+async def sequential(sockets, frame):
+    # The original notify_all_users loop, kept as the baseline
+    for socket in sockets:
+        await socket.send_text(frame.text)
+
+
+async def queued(outbounds, frame):
+    for outbound in outbounds:
+        outbound.put(frame)
+    await asyncio.gather(*(o.socket.received.wait() for o in outbounds if not o.socket.stalled))
+
+
+async def measure(fn, sockets, target, frame, rounds):
+    total = 0.0
+    for _ in range(rounds):
+        for socket in sockets:
+            socket.received.clear()
+        start = time.perf_counter()
+        await fn(target, frame)
+        total += time.perf_counter() - start
+    return total / rounds * 1000
+
+
+async def run(latency: float, stall: bool, timeout: float, rounds: int):
+    frame = Frame.encode({"command": "state", "name": "pos", "value": 12.5, "extra": {}})
+    print(f"{'members':>8} {'sequential ms':>14} {'queued ms':>14}")
+    for size in ROOM_SIZES:
+        sockets = [FakeSocket(latency) for _ in range(size)]
+        if stall:
+            sockets[0].stalled = True
+        seq = "-" if stall else f"{await measure(sequential, sockets, sockets, frame, rounds):.2f}"
+        outbounds = [
+            MemberOutbound(i, socket, lambda *_: None, send_timeout=timeout)
+            for i, socket in enumerate(sockets)
+        ]
+        for outbound in outbounds:
+            outbound.start()
+        con = await measure(queued, sockets, outbounds, frame, rounds)
+        for outbound in outbounds:
+            outbound.stop()
+        print(f"{size:>8} {seq:>14} {con:>14.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.002, help="per-send latency in seconds")
+    parser.add_argument("--timeout", type=float, default=5.0, help="per-send deadline in seconds")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--stall", action="store_true", help="make one member never complete a send")
+    args = parser.parse_args()
+    asyncio.run(run(args.latency, args.stall, args.timeout, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
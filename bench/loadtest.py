@@ -0,0 +1,217 @@
+"""End-to-end load test of a room through the test WebSocket endpoints.
+
+Run from the repository root:
+
+    python -m bench.loadtest --spawn [--members 100] [--rate 50] [--duration 10] [--json out.json]
+
+One synthetic master connects to /ws/test_master and replays mpv-like
+property traffic (mostly pos, with volume, pause and seek) at `--rate`
+messages per second; `--members` synthetic members connect to
+/ws/test_member. Every master message carries a sequence number in
+`extra`, so each member can time its delivery against the send time.
+Everything runs on one machine, so no clock correction is needed.
+
+`--spawn` starts a single-worker server on `--port` with the runtime
+`--profile` (see RUNTIME_PROFILES in src/_main.py), so profiles can be
+compared run against run; otherwise the server at `--host:--port` is used. Server CPU is read from /metrics, which only
+covers one worker. The JSON report can be compared across runs.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import urllib.request
+
+import websockets
+
+TRAFFIC = (("pos", 0.8), ("volume", 0.1), ("pause", 0.05), ("seek", 0.05))
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def read_metric(base_url: str, name: str) -> float:
+    with urllib.request.urlopen(f"{base_url}/metrics", timeout=5) as response:
+        for line in response.read().decode().splitlines():
+            if line.startswith(name + " "):
+                return float(line.split()[1])
+    return float("nan")
+
+
+async def answer_ping(ws, message: dict) -> None:
+    now = time.time()
+    await ws.send(json.dumps({"command": "pong", "extra": {"t0": message["extra"]["t0"], "t1": now, "t2": now}}))
+
+
+class Traffic:
+    '''Generates property changes that always differ from the previous value.'''
+    def __init__(self):
+        self.pos = 0.0
+        self.volume = 50
+        self.pause = False
+        self.names = [name for name, _ in TRAFFIC]
+        self.weights = [weight for _, weight in TRAFFIC]
+
+    def next(self, seq: int) -> dict:
+        name = random.choices(self.names, self.weights)[0]
+        if name == "pos":
+            self.pos += 0.1
+            message = {"command": "state", "name": "pos", "value": round(self.pos, 3)}
+        elif name == "volume":
+            self.volume = (self.volume + random.randint(1, 10)) % 101
+            message = {"command": "state", "name": "volume", "value": self.volume}
+        elif name == "pause":
+            self.pause = not self.pause
+            message = {"command": "state", "name": "pause", "value": self.pause}
+        else:
+            self.pos = random.uniform(0, 3600)
+            message = {"command": "action", "name": "seek", "value": round(self.pos, 3)}
+        message["timestamp"] = time.time()
+        message["extra"] = {"seq": seq}
+        return message
+
+
+async def member(url: str, sent: dict[int, float], latencies: list[float], ready: asyncio.Event, stop: asyncio.Event):
+    async with websockets.connect(url, max_queue=None) as ws:
+        ready.set()
+        while not stop.is_set():
+            try:
+                raw = await asyncio.wait_for(ws.recv(), 0.5)
+            except asyncio.TimeoutError:
+                continue
+            now = time.perf_counter()
+            message = json.loads(raw)
+            if message.get("command") == "ping":
+                await answer_ping(ws, message)
+                continue
+            # With an outbound batch window every delivery arrives inside a batch frame
+            messages = message["extra"]["messages"] if message.get("command") == "batch" else (message,)
+            for item in messages:
+                seq = (item.get("extra") or {}).get("seq")
+                if seq is not None and seq in sent:
+                    latencies.append(now - sent[seq])
+
+
+async def master(url: str, rate: float, duration: float, sent: dict[int, float]) -> int:
+    traffic = Traffic()
+    async with websockets.connect(url) as ws:
+        async def pong():
+            async for raw in ws:
+                message = json.loads(raw)
+                if message.get("command") == "ping":
+                    await answer_ping(ws, message)
+        responder = asyncio.create_task(pong())
+        interval = 1 / rate
+        start = time.perf_counter()
+        seq = 0
+        while (now := time.perf_counter()) - start < duration:
+            sent[seq] = now
+            await ws.send(json.dumps(traffic.next(seq)))
+            seq += 1
+            await asyncio.sleep(max(0.0, start + seq * interval - time.perf_counter()))
+        responder.cancel()
+        return seq
+
+
+async def run(args) -> dict:
+    base = f"ws://{args.host}:{args.port}/ws"
+    http = f"http://{args.host}:{args.port}"
+    sent: dict[int, float] = {}
+    latencies: list[float] = []
+    stop = asyncio.Event()
+    readies = [asyncio.Event() for _ in range(args.members)]
+    members = [
+        asyncio.create_task(member(f"{base}/test_member", sent, latencies, ready, stop))
+        for ready in readies
+    ]
+    await asyncio.gather(*(ready.wait() for ready in readies))
+    cpu_before = await asyncio.to_thread(read_metric, http, "mpv_sync_process_cpu_seconds")
+    start = time.perf_counter()
+    messages = await master(f"{base}/test_master", args.rate, args.duration, sent)
+    # Let the last frames drain
+    await asyncio.sleep(args.drain)
+    elapsed = time.perf_counter() - start
+    cpu = await asyncio.to_thread(read_metric, http, "mpv_sync_process_cpu_seconds") - cpu_before
+    stop.set()
+    await asyncio.gather(*members, return_exceptions=True)
+
+    latencies.sort()
+    expected = messages * args.members
+    return {
+        "profile": args.profile if args.spawn else None,
+        "members": args.members,
+        "rate": args.rate,
+        "duration": args.duration,
+        "messages": messages,
+        "deliveries": len(latencies),
+        # Superseded property updates are coalesced on purpose, so this can be below 1
+        "delivery_ratio": len(latencies) / expected if expected else 0.0,
+        "deliveries_per_second": len(latencies) / elapsed,
+        "latency_ms": {
+            "p50": percentile(latencies, 0.5) * 1e3,
+            "p99": percentile(latencies, 0.99) * 1e3,
+            "p999": percentile(latencies, 0.999) * 1e3,
+            "max": (latencies[-1] if latencies else float("nan")) * 1e3,
+        },
+        "server_cpu_seconds": cpu,
+        "server_cpu_us_per_message": cpu / messages * 1e6 if messages else float("nan"),
+        "server_cpu_us_per_delivery": cpu / len(latencies) * 1e6 if latencies else float("nan"),
+    }
+
+
+def spawn_server(port: int, profile: str) -> subprocess.Popen:
+    code = (
+        "import uvicorn; from src._main import runtime_options; "
+        f"uvicorn.run('src._main:app', port={port}, log_level='warning', **runtime_options({profile!r}))"
+    )
+    # The test endpoints log every disconnect; keep that out of the report
+    server = subprocess.Popen(
+        [sys.executable, "-c", code], cwd=os.getcwd(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=1)
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("Server did not come up")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8961)
+    parser.add_argument("--spawn", action="store_true", help="start a local server for the run")
+    parser.add_argument("--profile", default="performance", help="runtime profile of the spawned server")
+    parser.add_argument("--members", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=50.0, help="master messages per second")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--drain", type=float, default=1.0)
+    parser.add_argument("--json", default=None, help="write the report to this file")
+    args = parser.parse_args()
+
+    server = spawn_server(args.port, args.profile) if args.spawn else None
+    try:
+        report = asyncio.run(run(args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    text = json.dumps(report, indent=2)
+    if args.json:
+        with open(args.json, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
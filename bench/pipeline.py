@@ -0,0 +1,159 @@
+"""Microbenchmarks for each stage of the room message pipeline.
+
+Run from the repository root:
+
+    python -m bench.pipeline [--filter state.update] [--save baseline.json]
+    python -m bench.pipeline --compare baseline.json [--threshold 0.15]
+
+Every case reports the best of `--repeat` runs in ns per operation. With
+`--compare`, cases that got slower than the saved baseline by more than
+`--threshold` (a fraction) are flagged and the exit status is 1, so the
+suite can gate changes to src/session/room.py.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+import timeit
+from typing import Callable
+
+from src.session.message import Message, decode_message
+from src.session.room import STATE_PROPERTIES, Description, Room, State, StateProperty
+from src.user import User
+
+
+def sample_value(prop: StateProperty):
+    # Numeric properties take 1.5 (ints as 1), boolean ones reject it
+    try:
+        return prop.coerce(1.5)
+    except TypeError:
+        return True
+
+
+# Every name of every tracked property, so new STATE_PROPERTIES entries get benchmarked too
+STATE_MESSAGES = {
+    name: (prop.command, sample_value(prop)) for prop in STATE_PROPERTIES for name in prop.names
+}
+FANOUT_MEMBERS = 100
+
+
+def sync_cases() -> dict[str, Callable[[], object]]:
+    cases = {}
+    raw = json.dumps({"command": "state", "name": "pos", "value": 12.5, "timestamp": 1.0, "extra": {}}).encode()
+    cases["message.decode"] = lambda: decode_message(raw)
+    decoded = decode_message(raw)
+    cases["message.access"] = lambda: (decoded.command, decoded.name, decoded.value, decoded.timestamp, decoded.extra)
+
+    state = State()
+    for name, (command, value) in STATE_MESSAGES.items():
+        # Alternate values so every update is a real change; one op is two updates
+        on, off = Message(command, name, value, 1.0), Message(command, name, type(value)(0), 1.0)
+        def update(state=state, on=on, off=off):
+            state.update(on)
+            state.update(off)
+        cases[f"state.update.{name}"] = update
+    cases["state.to_dict"] = lambda: state.to_dict(1.0)
+
+    description = Description()
+    description.update(Message("desc", extra={"filename": "a.mkv", "filesize": 1, "duration": 60, "pos": 0.0}))
+    cases["description.to_dict"] = lambda: description.to_dict(1.0)
+
+    message = Message("state", "pos", 12.5, 1.0, {})
+    def pack():
+        message.frame = None
+        Room.pack_message(message)
+    cases["room.pack_message"] = pack
+    return cases
+
+
+class FakeSocket:
+    def __init__(self, sink: "Sink"):
+        self.sink = sink
+
+    async def send_text(self, text: str):
+        self.sink.received += 1
+        if self.sink.received >= self.sink.expected:
+            self.sink.done.set()
+
+    async def close(self, code=1000, reason=None):
+        pass
+
+
+class Sink:
+    def __init__(self):
+        self.received = 0
+        self.expected = 0
+        self.done = asyncio.Event()
+
+
+async def fanout_case(number: int) -> float:
+    '''ns per member delivery, from notify_all_users until the fake socket got the frame.'''
+    room = Room(User(1, "master", ""), "bench")
+    sink = Sink()
+    for user_id in range(2, FANOUT_MEMBERS + 2):
+        room.add_connected_socket(user_id, FakeSocket(sink))
+    start = time.perf_counter()
+    for i in range(number):
+        sink.expected += FANOUT_MEMBERS
+        sink.done.clear()
+        await room.notify_all_users(Message("state", "pos", float(i), 1.0, {}))
+        await sink.done.wait()
+    elapsed = time.perf_counter() - start
+    for user_id in list(room.connected_users):
+        room.remove_connected_socket(user_id)
+    return elapsed / (number * FANOUT_MEMBERS) * 1e9
+
+
+def run(selected: Callable[[str], bool], repeat: int) -> dict[str, float]:
+    results = {}
+    for name, fn in sync_cases().items():
+        if not selected(name):
+            continue
+        number, _ = timeit.Timer(fn).autorange()
+        results[name] = min(timeit.repeat(fn, number=number, repeat=repeat)) / number * 1e9
+    name = f"room.fanout.{FANOUT_MEMBERS}"
+    if selected(name):
+        results[name] = min(asyncio.run(fanout_case(200)) for _ in range(repeat))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filter", default="", help="only run cases whose name contains this")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save", default=None, help="write results to this JSON file")
+    parser.add_argument("--compare", default=None, help="compare against a JSON file written by --save")
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed slowdown, as a fraction")
+    args = parser.parse_args()
+
+    results = run(lambda name: args.filter in name, args.repeat)
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    regressions = []
+    print(f"{'case':<34} {'ns/op':>10} {'baseline':>10} {'change':>8}")
+    for name, value in results.items():
+        line = f"{name:<34} {value:>10.1f}"
+        if name in baseline:
+            change = value / baseline[name] - 1
+            flag = ""
+            if change > args.threshold:
+                regressions.append(name)
+                flag = "  REGRESSION"
+            line += f" {baseline[name]:>10.1f} {change:>+7.1%}{flag}"
+        print(line)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+    if regressions:
+        print(f"{len(regressions)} case(s) slower than baseline by more than {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
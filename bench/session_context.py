@@ -0,0 +1,52 @@
+"""Cost of opening and closing a database session.
+
+Run from the repository root:
+
+    python -m bench.session_context [--number 20000]
+
+No query is issued, so this is the pure setup and teardown overhead every
+request pays. "all handlers" touches every registered handler, which is
+what each session used to pay up front before handlers were bound lazily.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from src.database.engine import create_sqlite_engine
+from src.database.session import HandlerBind
+from src.prog import Program
+
+
+async def measure(program: Program, number: int, names: tuple[str, ...]) -> float:
+    start = time.perf_counter()
+    for _ in range(number):
+        async with program.session_context() as session:
+            for name in names:
+                getattr(session, name)
+    return (time.perf_counter() - start) / number
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=20_000)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_sqlite_engine(os.path.join(tmp, "bench.sqlite3"))
+        program = Program(engine)
+        cases = {
+            "no handler": (),
+            "one handler": ("user",),
+            "all handlers": tuple(HandlerBind.__handlers_map__),
+        }
+        print(f"{'case':>14} {'us/session':>11}")
+        for case, names in cases.items():
+            await measure(program, 1000, names)
+            best = min([await measure(program, args.number, names) for _ in range(3)])
+            print(f"{case:>14} {best * 1e6:>11.2f}")
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,74 @@
+"""User lookup and insert throughput with and without the SQLite tuning profile.
+
+Run from the repository root:
+
+    python -m bench.sqlite [--users 2000] [--lookups 20000] [--concurrency 8]
+
+"baseline" is the engine as it was before tuning: no PRAGMAs and no index on
+the lookup columns. "tuned" uses the configured profile and the schema's
+unique indexes. Each insert commits on its own, as a registration does.
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import text
+
+from src.database import Session, UserModel
+from src.database.engine import create_sqlite_engine, sqlite_pragmas
+
+
+async def run_profile(path: str, tuned: bool, args) -> tuple[float, float]:
+    engine = create_sqlite_engine(path, sqlite_pragmas() if tuned else None, pool=tuned)
+    async with Session(engine) as session:
+        await session.create_all()
+    if not tuned:
+        async with engine.begin() as conn:
+            for index in UserModel.__table__.indexes:
+                await conn.execute(text(f"DROP INDEX {index.name}"))
+
+    async def insert(ids):
+        for i in ids:
+            async with Session(engine) as session:
+                session.add(UserModel(
+                    user_id=i, username=f"user{i}", password_hash="", hash_algorithm="bcrypt", salt=""
+                ))
+                await session.commit()
+
+    async def lookup(names):
+        for name in names:
+            async with Session(engine) as session:
+                assert await session.user.get_by(username=name) is not None
+
+    ids = list(range(args.users))
+    start = time.perf_counter()
+    await asyncio.gather(*(insert(ids[k::args.concurrency]) for k in range(args.concurrency)))
+    inserts = args.users / (time.perf_counter() - start)
+
+    names = [f"user{random.randrange(args.users)}" for _ in range(args.lookups)]
+    start = time.perf_counter()
+    await asyncio.gather(*(lookup(names[k::args.concurrency]) for k in range(args.concurrency)))
+    lookups = args.lookups / (time.perf_counter() - start)
+    await engine.dispose()
+    return inserts, lookups
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--lookups", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+    print(f"{'profile':>10} {'inserts/s':>10} {'lookups/s':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for tuned in (False, True):
+            name = "tuned" if tuned else "baseline"
+            inserts, lookups = await run_profile(os.path.join(tmp, f"{name}.sqlite3"), tuned, args)
+            print(f"{name:>10} {inserts:>10.0f} {lookups:>10.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
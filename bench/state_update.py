@@ -0,0 +1,43 @@
+"""Per-message cost of State.update.
+
+The "decode" column includes decoding the raw frame as the WebSocket
+endpoints do; the "update" column feeds an already decoded Message so only
+the State engine itself is measured.
+
+Run from the repository root:
+
+    python -m bench.state_update [--number 200000]
+"""
+import argparse
+import json
+import timeit
+
+from src.session.message import decode_message
+from src.session.room import State
+
+from .pipeline import STATE_MESSAGES
+
+MESSAGES = {
+    name: {"command": command, "name": name, "value": value, "timestamp": 1.0}
+    for name, (command, value) in STATE_MESSAGES.items()
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=200_000)
+    args = parser.parse_args()
+    state = State()
+    print(f"{'message':>16} {'decode ns':>10} {'update ns':>10}")
+    for name, message in MESSAGES.items():
+        raw = json.dumps(message).encode()
+        decoded = decode_message(raw)
+        row = []
+        for fn in (lambda: state.update(decode_message(raw)), lambda: state.update(decoded)):
+            best = min(timeit.repeat(fn, number=args.number, repeat=3))
+            row.append(best / args.number * 1e9)
+        print(f"{name:>16} {row[0]:>10.0f} {row[1]:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
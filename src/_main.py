@@ -1,20 +1,111 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional
 from fastapi import FastAPI
 from src.session.ws import router as ws_router
+from src.session.room import get_room_manager
+from src.session.backplane import create_backplane
+from src.session.persist import RoomStore
 from .api import router as api_router
-from .prog import init_program
+from .jwt import password_pool
+from .metrics import router as metrics_router, monitor_loop_lag
+from . import prog
 from .config import settings
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Users need their tables and indexes whether or not rooms are persisted
+    async with prog.program.session_context() as session:
+        await session.create_all()
+    room_manager = get_room_manager()
+    store = RoomStore(prog.program) if settings.persist_rooms else None
+    if store is not None:
+        await room_manager.attach_store(store)
+    backplane = create_backplane()
+    if backplane is not None:
+        await room_manager.attach_backplane(backplane)
+    room_manager.start_reaper()
+    lag_monitor = None
+    if settings.metrics_loop_lag_interval > 0:
+        lag_monitor = asyncio.create_task(monitor_loop_lag())
+    yield
+    if lag_monitor is not None:
+        lag_monitor.cancel()
+    room_manager.stop_reaper()
+    if backplane is not None:
+        await backplane.stop()
+    if store is not None:
+        await store.stop()
+    password_pool.shutdown()
+
+app = FastAPI(lifespan=lifespan)
 app.include_router(ws_router)
 app.include_router(api_router)
-init_program()
+app.include_router(metrics_router)
+prog.init_program()
+
+RUNTIME_PROFILES = {
+    # uvicorn's own defaults
+    "compat": {
+        "loop": "asyncio",
+        "http": "h11",
+        "ws": "websockets",
+        "ws_per_message_deflate": True,
+        "ws_max_size": 16 * 1024 * 1024,
+        "ws_max_queue": 32,
+    },
+    # Sync frames are a few hundred bytes: deflate costs CPU without saving bandwidth
+    "performance": {
+        "loop": "uvloop",
+        "http": "httptools",
+        "ws": "websockets",
+        "ws_per_message_deflate": False,
+        "ws_max_size": 1024 * 1024,
+        "ws_max_queue": 32,
+    },
+}
+
+def _available(module: str) -> bool:
+    from importlib.util import find_spec
+    return find_spec(module) is not None
+
+def runtime_options(profile: Optional[str] = None) -> dict:
+    '''uvicorn options for a runtime profile, with explicit settings taking precedence.'''
+    options = dict(RUNTIME_PROFILES[settings.runtime_profile if profile is None else profile])
+    overrides = {
+        "loop": settings.runtime_loop,
+        "http": settings.runtime_http,
+        "ws": settings.runtime_ws,
+        "ws_per_message_deflate": settings.ws_per_message_deflate,
+        "ws_max_size": settings.ws_max_size,
+        "ws_max_queue": settings.ws_max_queue,
+    }
+    options.update((k, v) for k, v in overrides.items() if v is not None)
+    # Optional accelerators fall back to the pure Python implementations
+    if options["loop"] == "uvloop" and not _available("uvloop"):
+        options["loop"] = "asyncio"
+    if options["http"] == "httptools" and not _available("httptools"):
+        options["http"] = "h11"
+    return options
 
 def main():
     import uvicorn
     
-    uvicorn.run(
-        app,
-        ws="websockets",
-        host=settings.host,
-        port=settings.port,
-    )
\ No newline at end of file
+    broker = None
+    if settings.backplane == "socket" and settings.backplane_run_broker:
+        from multiprocessing import Process
+        from src.session.backplane import run_broker
+        broker = Process(target=run_broker, args=(settings.backplane_address,), daemon=True)
+        broker.start()
+    try:
+        uvicorn.run(
+            # Workers re-import the app, so it has to be given by name
+            "src._main:app" if settings.workers > 1 else app,
+            host=settings.host,
+            port=settings.port,
+            workers=settings.workers,
+            **runtime_options(),
+        )
+    finally:
+        if broker is not None:
+            broker.terminate()
@@ -2,8 +2,8 @@ from datetime import timedelta
 from fastapi import APIRouter, HTTPException, Cookie, status
 from fastapi.responses import Response, JSONResponse
 from src.user import create_user, UserAlreadyExists
-from .prog import program
-from .jwt import verify_token, create_access_token, verify_password
+from . import prog
+from .jwt import verify_token, create_access_token, verify_password, PasswordPoolBusy
 
 router = APIRouter(prefix="/api")
 
@@ -12,6 +12,12 @@ UNAUTHORIZED = HTTPException(
     detail="Unauthorized",
 )
 
+BUSY = HTTPException(
+    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+    detail="Server busy, try again later",
+    headers={"Retry-After": "1"},
+)
+
 def get_current_user(token: str = Cookie(None)):
     if not token:
         raise UNAUTHORIZED
@@ -24,13 +30,17 @@ def get_current_user(token: str = Cookie(None)):
     return username
 
 async def auth_user(username: str, password: str):
-    async with program.session_context() as session:
+    async with prog.program.session_context() as session:
         user = await session.user.get_by(username=username)
-        if user is None:
-            return {"status": False, "status_code": 401, "message": "User not found"}
-        if not verify_password(user.password_hash, password):
-            return {"status": False, "status_code": 401, "message": "Invalid password"}
-        return {"status": True, "status_code": 200, "message": "Login successful"}
+    if user is None:
+        return {"status": False, "status_code": 401, "message": "User not found"}
+    try:
+        verified = await verify_password(password, user.password_hash)
+    except PasswordPoolBusy:
+        raise BUSY
+    if not verified:
+        return {"status": False, "status_code": 401, "message": "Invalid password"}
+    return {"status": True, "status_code": 200, "message": "Login successful"}
 
 @router.post("/login", response_model=dict)
 async def login(response: JSONResponse):
@@ -65,4 +75,6 @@ async def register(response: JSONResponse):
         user = await create_user(username, password)
     except UserAlreadyExists:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="User name has already been used")
+    except PasswordPoolBusy:
+        raise BUSY
     return {"status": True, "status_code": 200, "message": "Registration successful"}
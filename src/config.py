@@ -1,6 +1,6 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from pydantic_settings import SettingsConfigDict
-from typing import ClassVar
+from typing import ClassVar, Literal, Optional
 
 CONF_PATH = "config/config.json"
 
@@ -12,5 +12,72 @@ class Config(BaseModel):
     host: str = Field(default="0.0.0.0", env="MPV_SYNC_SERVER_HOST")
     port: int = Field(default=8961, env="MPV_SYNC_SERVER_PORT")
     debug: bool = Field(default=False, env="MPV_SYNC_SERVER_DEBUG")
+    sqlite_journal_mode: Optional[str] = Field(default="WAL", env="MPV_SYNC_SQLITE_JOURNAL_MODE")
+    sqlite_synchronous: Optional[str] = Field(default="NORMAL", env="MPV_SYNC_SQLITE_SYNCHRONOUS")
+    sqlite_busy_timeout: Optional[int] = Field(default=5000, env="MPV_SYNC_SQLITE_BUSY_TIMEOUT")
+    # Negative values are in KiB
+    sqlite_cache_size: Optional[int] = Field(default=-16384, env="MPV_SYNC_SQLITE_CACHE_SIZE")
+    sqlite_mmap_size: Optional[int] = Field(default=64 * 1024 * 1024, env="MPV_SYNC_SQLITE_MMAP_SIZE")
+    sqlite_temp_store: Optional[str] = Field(default="MEMORY", env="MPV_SYNC_SQLITE_TEMP_STORE")
+    database_pool_size: int = Field(default=5, env="MPV_SYNC_DATABASE_POOL_SIZE")
+    database_max_overflow: int = Field(default=10, env="MPV_SYNC_DATABASE_MAX_OVERFLOW")
+    broadcast_send_timeout: float = Field(default=2.0, env="MPV_SYNC_BROADCAST_SEND_TIMEOUT")
+    outbound_queue_size: int = Field(default=256, env="MPV_SYNC_OUTBOUND_QUEUE_SIZE")
+    outbound_high_water: int = Field(default=64, env="MPV_SYNC_OUTBOUND_HIGH_WATER")
+    outbound_high_water_grace: float = Field(default=5.0, env="MPV_SYNC_OUTBOUND_HIGH_WATER_GRACE")
+    ingress_rate: float = Field(default=50.0, env="MPV_SYNC_INGRESS_RATE")
+    ingress_burst: float = Field(default=100.0, env="MPV_SYNC_INGRESS_BURST")
+    ingress_type_rate: float = Field(default=20.0, env="MPV_SYNC_INGRESS_TYPE_RATE")
+    ingress_type_burst: float = Field(default=40.0, env="MPV_SYNC_INGRESS_TYPE_BURST")
+    ingress_action: Literal["drop", "coalesce", "disconnect"] = Field(default="coalesce", env="MPV_SYNC_INGRESS_ACTION")
+    outbound_batch_window: float = Field(default=0.0, env="MPV_SYNC_OUTBOUND_BATCH_WINDOW")
+    outbound_batch_max: int = Field(default=32, env="MPV_SYNC_OUTBOUND_BATCH_MAX")
+    outbound_overflow_policy: Literal["disconnect", "drop_oldest"] = Field(
+        default="disconnect", env="MPV_SYNC_OUTBOUND_OVERFLOW_POLICY"
+    )
+    sync_tick_interval: float = Field(default=5.0, env="MPV_SYNC_SYNC_TICK_INTERVAL")
+    state_snapshot_max_age: float = Field(default=0.25, env="MPV_SYNC_STATE_SNAPSHOT_MAX_AGE")
+    timesync_interval: float = Field(default=15.0, env="MPV_SYNC_TIMESYNC_INTERVAL")
+    resume_buffer_size: int = Field(default=256, env="MPV_SYNC_RESUME_BUFFER_SIZE")
+    resume_ttl: float = Field(default=120.0, env="MPV_SYNC_RESUME_TTL")
+    room_reap_interval: float = Field(default=60.0, env="MPV_SYNC_ROOM_REAP_INTERVAL")
+    room_idle_timeout: float = Field(default=600.0, env="MPV_SYNC_ROOM_IDLE_TIMEOUT")
+    room_master_gone_timeout: float = Field(default=1800.0, env="MPV_SYNC_ROOM_MASTER_GONE_TIMEOUT")
+    persist_rooms: bool = Field(default=True, env="MPV_SYNC_PERSIST_ROOMS")
+    persist_debounce: float = Field(default=1.0, env="MPV_SYNC_PERSIST_DEBOUNCE")
+    workers: int = Field(default=1, env="MPV_SYNC_WORKERS")
+    backplane: Literal["none", "inprocess", "socket"] = Field(default="none", env="MPV_SYNC_BACKPLANE")
+    backplane_address: str = Field(default="127.0.0.1:8962", env="MPV_SYNC_BACKPLANE_ADDRESS")
+    backplane_run_broker: bool = Field(default=True, env="MPV_SYNC_BACKPLANE_RUN_BROKER")
+    runtime_profile: Literal["compat", "performance"] = Field(default="performance", env="MPV_SYNC_RUNTIME_PROFILE")
+    # Each of these overrides the profile when set
+    runtime_loop: Optional[Literal["asyncio", "uvloop"]] = Field(default=None, env="MPV_SYNC_RUNTIME_LOOP")
+    runtime_http: Optional[Literal["h11", "httptools"]] = Field(default=None, env="MPV_SYNC_RUNTIME_HTTP")
+    runtime_ws: Optional[Literal["websockets", "websockets-sansio", "wsproto"]] = Field(
+        default=None, env="MPV_SYNC_RUNTIME_WS"
+    )
+    ws_per_message_deflate: Optional[bool] = Field(default=None, env="MPV_SYNC_WS_PER_MESSAGE_DEFLATE")
+    ws_max_size: Optional[int] = Field(default=None, env="MPV_SYNC_WS_MAX_SIZE")
+    ws_max_queue: Optional[int] = Field(default=None, env="MPV_SYNC_WS_MAX_QUEUE")
+    log_file: str = Field(default="log.txt", env="MPV_SYNC_LOG_FILE")
+    log_json_file: Optional[str] = Field(default=None, env="MPV_SYNC_LOG_JSON_FILE")
+    log_queue_size: int = Field(default=10000, env="MPV_SYNC_LOG_QUEUE_SIZE")
+    log_rate_limit_burst: int = Field(default=10, env="MPV_SYNC_LOG_RATE_LIMIT_BURST")
+    log_rate_limit_interval: float = Field(default=10.0, env="MPV_SYNC_LOG_RATE_LIMIT_INTERVAL")
+    log_sample_every: int = Field(default=100, env="MPV_SYNC_LOG_SAMPLE_EVERY")
+    metrics_loop_lag_interval: float = Field(default=1.0, env="MPV_SYNC_METRICS_LOOP_LAG_INTERVAL")
+    user_cache_size: int = Field(default=1024, env="MPV_SYNC_USER_CACHE_SIZE")
+    user_cache_ttl: float = Field(default=60.0, env="MPV_SYNC_USER_CACHE_TTL")
+    password_workers: int = Field(default=2, env="MPV_SYNC_PASSWORD_WORKERS")
+    password_max_pending: int = Field(default=64, env="MPV_SYNC_PASSWORD_MAX_PENDING")
+    user_id_block_size: int = Field(default=64, env="MPV_SYNC_USER_ID_BLOCK_SIZE")
+    password_executor: Literal["thread", "process"] = Field(default="thread", env="MPV_SYNC_PASSWORD_EXECUTOR")
+
+    @model_validator(mode="after")
+    def _check_backplane(self):
+        # Without a shared backplane every worker would keep its own, partitioned set of rooms
+        if self.workers > 1 and self.backplane != "socket":
+            raise ValueError(f'workers > 1 needs backplane "socket", got {self.backplane!r}')
+        return self
 
 settings = Config()
\ No newline at end of file
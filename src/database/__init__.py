@@ -1,11 +1,13 @@
 from .user import UserModel
 from .user_id import UserIDModel
+from .room import RoomModel
 from .session import Session
 from .engine import get_async_engine, metadata
 
 __all__ = [
     "UserModel", 
     "UserIDModel",
+    "RoomModel",
     "Session", 
     "get_async_engine", 
     "metadata"
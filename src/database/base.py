@@ -1,4 +1,6 @@
-from typing import Optional, Union, TypeVar, Generic, Type, TYPE_CHECKING
+from typing import AsyncIterator, Iterable, Optional, Union, TypeVar, Generic, Type, TYPE_CHECKING
+from sqlalchemy import bindparam, delete, insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlmodel import select
 from sqlmodel.sql.expression import SelectOfScalar
 
@@ -7,30 +9,97 @@ T = TypeVar("T")
 if TYPE_CHECKING:
     from .session import Session
 
+# Stays below SQLite's limit on bound parameters per statement
+MAX_IN_CLAUSE = 500
+
 class BaseSessionHandler(Generic[T]):
     __model_class__: Type[T] = None
     if TYPE_CHECKING:
         session: Session
 
-    def __new__(cls):
+    def __new__(cls, *args, **kwargs):
         if not cls.__model_class__:
             raise NotImplementedError("Model class not defined for this handler")
+        return super().__new__(cls)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Statements for each filter shape, e.g. ("username",), built once per handler class
+        cls._statements: dict[tuple[str, ...], SelectOfScalar[T]] = {}
 
     def __init__(self, session):
         self.session = session
+
+    def _statement_for(self, shape: tuple[str, ...]) -> SelectOfScalar[T]:
+        statement = self._statements.get(shape)
+        if statement is None:
+            model = self.__model_class__
+            statement = select(model).where(*(getattr(model, name) == bindparam(name) for name in shape))
+            self._statements[shape] = statement
+        return statement
     
     async def get_by(self, fetch_all: bool = False, unique: bool = False, **filters) -> Optional[Union[T, list[T]]]:
         if unique and not fetch_all:
             raise ValueError("Fetch all must be True when unique is True")
-        statement = select(self.__model_class__).filter_by(**filters)
-        return await self._fetch_all(statement, unique) if fetch_all else await self._fetch_one(statement)
+        statement = self._statement_for(tuple(sorted(filters)))
+        return await self._fetch_all(statement, unique, filters) if fetch_all else await self._fetch_one(statement, filters)
+
+    async def get_many(self, column: str, keys: Iterable) -> list[T]:
+        '''Rows whose `column` is any of `keys`, in no particular order.'''
+        keys = list(dict.fromkeys(keys))
+        model = self.__model_class__
+        results = []
+        for i in range(0, len(keys), MAX_IN_CLAUSE):
+            statement = select(model).where(getattr(model, column).in_(keys[i:i + MAX_IN_CLAUSE]))
+            results.extend(await self._fetch_all(statement))
+        return results
+
+    async def stream(self, batch_size: int = 500, **filters) -> AsyncIterator[T]:
+        '''Iterate over matching rows without loading them all into memory.'''
+        statement = self._statement_for(tuple(sorted(filters)))
+        results = await self.session.stream_scalars(
+            statement, filters, execution_options={"yield_per": batch_size}
+        )
+        async for row in results:
+            yield row
+
+    @staticmethod
+    def _to_dict(row: Union[T, dict]) -> dict:
+        return row if isinstance(row, dict) else row.model_dump()
+
+    async def insert_many(self, rows: Iterable[Union[T, dict]]) -> None:
+        '''Insert all rows in one executemany; the caller commits.'''
+        values = [self._to_dict(row) for row in rows]
+        if values:
+            await self.session.execute(insert(self.__model_class__), values)
+
+    async def upsert_many(self, rows: Iterable[Union[T, dict]], index_elements: Optional[list[str]] = None) -> None:
+        '''Insert rows, updating those that collide on `index_elements` (the primary key by default).'''
+        values = [self._to_dict(row) for row in rows]
+        if not values:
+            return
+        table = self.__model_class__.__table__
+        if index_elements is None:
+            index_elements = [column.name for column in table.primary_key]
+        statement = sqlite_insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=index_elements,
+            set_={name: statement.excluded[name] for name in values[0] if name not in index_elements},
+        )
+        await self.session.execute(statement, values)
+
+    async def delete_many(self, column: str, keys: Iterable) -> None:
+        keys = list(keys)
+        model = self.__model_class__
+        for i in range(0, len(keys), MAX_IN_CLAUSE):
+            await self.session.execute(delete(model).where(getattr(model, column).in_(keys[i:i + MAX_IN_CLAUSE])))
 
-    async def _fetch_one(self, statement: SelectOfScalar[T]) -> Optional[T]:
-        results = await self.session.execute(statement)
-        return results.first()
+    async def _fetch_one(self, statement: SelectOfScalar[T], params: Optional[dict] = None) -> Optional[T]:
+        results = await self.session.execute(statement, params)
+        return results.scalars().first()
     
-    async def _fetch_all(self, statement: SelectOfScalar[T], unique = False) -> list[T]:
-        results = await self.session.execute(statement)
+    async def _fetch_all(self, statement: SelectOfScalar[T], unique = False, params: Optional[dict] = None) -> list[T]:
+        results = await self.session.execute(statement, params)
         if unique:
             results = results.unique()
-        return results.all()
\ No newline at end of file
+        return results.scalars().all()
@@ -1,12 +1,41 @@
-from sqlalchemy.ext.asyncio import create_async_engine
+import os
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 from sqlmodel import MetaData
 from src.config import settings
 
 a_engine_g = None
 metadata = MetaData()
 
+def sqlite_pragmas() -> dict[str, object]:
+    '''PRAGMAs applied to every new connection; unset settings are left at the SQLite default.'''
+    pragmas = {
+        "journal_mode": settings.sqlite_journal_mode,
+        "synchronous": settings.sqlite_synchronous,
+        "busy_timeout": settings.sqlite_busy_timeout,
+        "cache_size": settings.sqlite_cache_size,
+        "mmap_size": settings.sqlite_mmap_size,
+        "temp_store": settings.sqlite_temp_store,
+    }
+    return {name: value for name, value in pragmas.items() if value is not None}
+
+def create_sqlite_engine(path: str, pragmas: dict[str, object] = None, pool: bool = True) -> AsyncEngine:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    kwargs = {}
+    if pool:
+        kwargs.update(pool_size=settings.database_pool_size, max_overflow=settings.database_max_overflow)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}", echo=settings.debug, **kwargs)
+    if pragmas:
+        @event.listens_for(engine.sync_engine, "connect")
+        def _apply_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+    return engine
+
 def get_async_engine():
     global a_engine_g
     if a_engine_g is None:
-        a_engine_g = create_async_engine(f"sqlite+aiosqlite:///{settings.database_url}", echo=settings.debug)
-    return a_engine_g
\ No newline at end of file
+        a_engine_g = create_sqlite_engine(settings.database_url, sqlite_pragmas())
+    return a_engine_g
@@ -0,0 +1,17 @@
+from sqlmodel import SQLModel, Field
+from .base import BaseSessionHandler
+from .engine import metadata as _metadata
+
+class RoomModel(SQLModel, table=True):
+    metadata = _metadata
+    uuid: str = Field(primary_key=True)
+    name: str
+    master_id: int
+    master_name: str
+    members: str = Field(default="[]")
+    state: str = Field(default="{}")
+    description: str = Field(default="{}")
+    updated_at: float = Field(default=0.0)
+
+class RoomSessionHandler(BaseSessionHandler[RoomModel]):
+    __model_class__ = RoomModel
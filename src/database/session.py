@@ -4,63 +4,80 @@ from .engine import metadata as metadata_
 from .base import BaseSessionHandler
 from .user import UserSessionHandler
 from .user_id import UserIDSessionHandler
+from .room import RoomSessionHandler
 
 
 SessionHandleT = TypeVar("SessionHandleT", bound=BaseSessionHandler)
 
+class LazyHandler:
+    '''Creates a session's handler the first time it is accessed.'''
+    def __init__(self, handler: Type[SessionHandleT]):
+        self.handler = handler
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, session, owner=None):
+        if session is None:
+            return self
+        include = session._include_handlers
+        if include is not None and self.handler not in include:
+            raise AttributeError(f"Handler {self.name!r} is not enabled for this session")
+        handler = self.handler(session)
+        # Cached on the instance, which shadows this non-data descriptor from now on
+        session.__dict__[self.name] = handler
+        return handler
+
 class HandlerRegistryMeta(type):
     def __new__(cls, name, bases, attrs):
         annotations = attrs.get("__annotations__", {})
-        if "__handlers_map__" not in attrs:
-            attrs["__handlers_map__"] = {}
+        handlers_map = {}
+        for base in bases:
+            handlers_map.update(getattr(base, "__handlers_map__", {}))
         for k, v in annotations.items():
             if k.startswith("_"):
                 continue
-            if issubclass(v, BaseSessionHandler):
-                attrs["__handlers_map__"][k] = v
+            if isinstance(v, type) and issubclass(v, BaseSessionHandler):
+                handlers_map[k] = v
+                attrs[k] = LazyHandler(v)
+        attrs["__handlers_map__"] = handlers_map
         return super().__new__(cls, name, bases, attrs)
 
-class InitBase:
-    __handlers_map__: ClassVar[dict[str, Type[SessionHandleT]]]
-    def init(self, include_handlers):
-        if include_handlers is None:
-            include_handlers = tuple(self.__handlers_map__.values())
-        
-        for name, handler in (
-                    (name, handler) for name, handler in self.__handlers_map__.items() 
-                        if handler in include_handlers
-                ):
-            setattr(self, name, handler(self))
-
-class HandlerBind(InitBase, metaclass=HandlerRegistryMeta):
+class HandlerBind(metaclass=HandlerRegistryMeta):
     __handlers_map__: ClassVar[dict[str, Type[SessionHandleT]]]
+    _include_handlers: Optional[frozenset[Type[SessionHandleT]]] = None
     
     user: UserSessionHandler
     user_id: UserIDSessionHandler
+    room: RoomSessionHandler
+
 
+def _create_all(conn, metadata):
+    metadata.create_all(conn)
+    # create_all skips tables that already exist, so add indexes introduced since
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
 
 class Session(AsyncSession, HandlerBind):
-    def __new__(cls, *args, **kwargs):
-        setattr(cls, "__handlers_map__", HandlerBind.__handlers_map__)
-        return super().__new__(cls)
-    
     def __init__(
         self, 
         engine: AsyncEngine, 
         include_handlers: Optional[tuple[Type[SessionHandleT]]] = None
     ):
         self._engine = engine
-        super().__init__(engine)
-        self.init(include_handlers)
+        super().__init__(engine, expire_on_commit=False)
+        if include_handlers is not None:
+            self._include_handlers = frozenset(include_handlers)
     
     async def create_all(self, metadata = None):
         if metadata is None:
             metadata = metadata_
         async with self._engine.begin() as conn:
-            conn.run_sync(metadata.create_all())
+            await conn.run_sync(_create_all, metadata)
     
     async def drop_all(self, metadata = None):
         if metadata is None:
             metadata = metadata_
         async with self._engine.begin() as conn:
-            conn.run_sync(metadata.drop_all())
\ No newline at end of file
+            await conn.run_sync(metadata.drop_all)
\ No newline at end of file
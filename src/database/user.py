@@ -5,8 +5,8 @@ from .engine import metadata as _metadata
 class UserModel(SQLModel, table=True):
     metadata = _metadata
     id: int = Field(primary_key=True)
-    user_id: int
-    username: str
+    user_id: int = Field(index=True, unique=True)
+    username: str = Field(index=True, unique=True)
     password_hash: str
     hash_algorithm: str
     salt: str
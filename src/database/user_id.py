@@ -1,3 +1,5 @@
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
 from sqlmodel import SQLModel, Field
 from .base import BaseSessionHandler
 from .engine import metadata as _metadata
@@ -8,4 +10,29 @@ class UserIDModel(SQLModel, table=True):
     latest_id: int = Field(default=0)
 
 class UserIDSessionHandler(BaseSessionHandler[UserIDModel]):
-    __model_class__ = UserIDModel
\ No newline at end of file
+    __model_class__ = UserIDModel
+
+    async def reserve(self, count: int, row: int = 0) -> int:
+        '''Reserve `count` consecutive raw ids in one commit and return the first.
+
+        The increment is a single UPDATE, so concurrent workers never hand out
+        the same range.
+        '''
+        statement = (
+            update(UserIDModel)
+            .where(UserIDModel.id == row)
+            .values(latest_id=UserIDModel.latest_id + count)
+            .returning(UserIDModel.latest_id)
+        )
+        latest = (await self.session.execute(statement)).scalar()
+        if latest is not None:
+            await self.session.commit()
+            return latest - count + 1
+        self.session.add(UserIDModel(id=row, latest_id=count - 1))
+        try:
+            await self.session.commit()
+        except IntegrityError:
+            # Another worker created the row first
+            await self.session.rollback()
+            return await self.reserve(count, row)
+        return 0
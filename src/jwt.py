@@ -1,7 +1,15 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from jose import jwt, JWTError
 from passlib.context import CryptContext
-from typing import Optional
+from typing import Callable, Literal, Optional, TypeVar
+from src.config import settings
+from src.metrics import registry, stats_gauge
+
+T = TypeVar("T")
 
 
 def generate_key():
@@ -41,8 +49,88 @@ def verify_token(token: str):
         raise JWTError("Token expired")
     return token_data
 
-def verify_password(plain_password, hashed_password):
+class PasswordPoolBusy(Exception):
+    '''Raised when too much password work is already waiting'''
+
+@dataclass
+class PasswordPoolStats:
+    queued: int = 0
+    running: int = 0
+    completed: int = 0
+    rejected: int = 0
+    max_queued: int = 0
+
+def _hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+def _verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
\ No newline at end of file
+class PasswordPool:
+    '''Runs bcrypt off the event loop in a dedicated executor.
+
+    At most `workers` hashes run at once; the rest wait here, where they are
+    counted, rather than inside the executor. Once `max_pending` are queued
+    or running, `run` raises `PasswordPoolBusy` so a login burst is shed
+    instead of piling up. Threads are the default since the bcrypt backend
+    releases the GIL; processes are there for backends that do not.
+    '''
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        max_pending: Optional[int] = None,
+        kind: Optional[Literal["thread", "process"]] = None,
+    ):
+        self.workers = settings.password_workers if workers is None else workers
+        self.max_pending = settings.password_max_pending if max_pending is None else max_pending
+        self.kind = settings.password_executor if kind is None else kind
+        self.stats = PasswordPoolStats()
+        self._executor: Optional[Executor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                # Forking a process that already runs threads (aiosqlite, the log listener) can deadlock
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            else:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="password")
+            self._slots = asyncio.Semaphore(self.workers)
+        return self._executor
+
+    async def run(self, fn: Callable[..., T], *args) -> T:
+        stats = self.stats
+        if stats.queued + stats.running >= self.max_pending:
+            stats.rejected += 1
+            raise PasswordPoolBusy("Too many password operations in flight")
+        executor = self._get_executor()
+        stats.queued += 1
+        stats.max_queued = max(stats.max_queued, stats.queued)
+        try:
+            await self._slots.acquire()
+        finally:
+            stats.queued -= 1
+        stats.running += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+        finally:
+            stats.running -= 1
+            stats.completed += 1
+            self._slots.release()
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._slots = None
+
+password_pool = PasswordPool()
+registry.register(stats_gauge(
+    "mpv_sync_password_pool", "Password hashing queue depth and outcomes", password_pool.stats
+))
+
+async def verify_password(plain_password, hashed_password):
+    return await password_pool.run(_verify_password, plain_password, hashed_password)
+
+async def get_password_hash(password):
+    return await password_pool.run(_hash_password, password)
\ No newline at end of file
@@ -1,10 +1,99 @@
+import atexit
+import json
 import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from time import monotonic
+from typing import Optional
 from rich.logging import RichHandler
+from src.config import settings
 
-def get_logger(name, level=logging.INFO, console=True, file=""):
+
+class RateLimitFilter(logging.Filter):
+    '''Lets `burst` records per call site and source through every `interval`
+    seconds, then only one in `sample_every`.
+
+    The source is the call site plus the optional `source` attribute passed
+    with `extra={"source": ...}`, so one noisy client cannot drown out the
+    others. The first record let through after a window reports how many
+    were suppressed in the previous one.
+    '''
+    MAX_KEYS = 4096
+
+    def __init__(self, burst: int, interval: float, sample_every: int):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.sample_every = sample_every
+        # key -> [window start, records seen in window, suppressed in window]
+        self._windows: dict[tuple, list] = {}
+        self.suppressed = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.CRITICAL or self.burst <= 0:
+            return True
+        key = (record.pathname, record.lineno, getattr(record, "source", None))
+        now = monotonic()
+        window = self._windows.get(key)
+        if window is None or now - window[0] >= self.interval:
+            if len(self._windows) >= self.MAX_KEYS:
+                self._windows.clear()
+            suppressed = 0 if window is None else window[2]
+            self._windows[key] = [now, 1, 0]
+            if suppressed:
+                record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+            return True
+        window[1] += 1
+        if window[1] <= self.burst or (self.sample_every > 0 and window[1] % self.sample_every == 0):
+            return True
+        window[2] += 1
+        self.suppressed += 1
+        return False
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    '''Hands records to the listener thread without formatting them first.
+
+    The queue is bounded; when the listener falls behind, records are
+    dropped and counted rather than blocking the caller.
+    '''
+    def __init__(self, queue_: queue.Queue):
+        super().__init__(queue_)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Same process, so the record can cross as is; formatting happens on the listener
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "func": record.funcName,
+            "message": record.getMessage(),
+        }
+        source = getattr(record, "source", None)
+        if source is not None:
+            entry["source"] = str(source)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+def get_logger(name, level=logging.INFO, console=True, file="", json_file: Optional[str] = None):
     logger = logging.getLogger(name)
-    
+
     logger.setLevel(level)
+    handlers = []
 
     if console:
         console_handler = RichHandler(
@@ -12,15 +101,30 @@ def get_logger(name, level=logging.INFO, console=True, file=""):
             show_path = False,
             markup = True
         )
-        logger.addHandler(console_handler)
-    
+        handlers.append(console_handler)
+
     if file:
         file_handler = logging.FileHandler(file)
         file_handler.setFormatter(logging.Formatter(
             "%(asctime)s %(levelname)s %(funcName)s %(message)s"
         ))
-        logger.addHandler(file_handler)
-    
+        handlers.append(file_handler)
+
+    if json_file:
+        json_handler = logging.FileHandler(json_file)
+        json_handler.setFormatter(JsonFormatter())
+        handlers.append(json_handler)
+
+    # Rendering and file I/O happen on the listener thread, never on the event loop
+    queue_handler = NonBlockingQueueHandler(queue.Queue(settings.log_queue_size))
+    queue_handler.addFilter(RateLimitFilter(
+        settings.log_rate_limit_burst, settings.log_rate_limit_interval, settings.log_sample_every
+    ))
+    logger.addHandler(queue_handler)
+    listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
     return logger
 
-logger = get_logger(__name__, file="log.txt")
+logger = get_logger(__name__, file=settings.log_file, json_file=settings.log_json_file)
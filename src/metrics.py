@@ -0,0 +1,175 @@
+import asyncio
+from bisect import bisect_left
+from dataclasses import asdict
+from contextlib import asynccontextmanager
+from time import perf_counter, process_time
+from typing import Callable, Iterable, Optional
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from src.config import settings
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def samples(self) -> Iterable[tuple[str, tuple[str, ...], tuple[str, ...], float]]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, names, values, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(names, values)} {value}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    '''Monotonic counter; with labels, `labels(...)` returns the per-series cell to `inc`.'''
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: dict[tuple[str, ...], list[float]] = {}
+        self._default = None if self.labelnames else self.labels()
+
+    def labels(self, *values: str) -> list[float]:
+        cell = self._values.get(values)
+        if cell is None:
+            cell = self._values[values] = [0]
+        return cell
+
+    def remove(self, *values: str) -> None:
+        self._values.pop(values, None)
+
+    def inc(self, amount: float = 1) -> None:
+        self._default[0] += amount
+
+    def samples(self):
+        for values, cell in self._values.items():
+            yield "_total", self.labelnames, values, cell[0]
+
+
+class Gauge(Metric):
+    '''Gauge read from `collect` at scrape time, so the hot path never touches it.'''
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        collect: Callable[[], Iterable[tuple[tuple[str, ...], float]]],
+        labelnames: Iterable[str] = (),
+    ):
+        super().__init__(name, help, labelnames)
+        self.collect = collect
+
+    def samples(self):
+        for values, value in self.collect():
+            yield "", self.labelnames, values, value
+
+
+def stats_gauge(name: str, help: str, stats) -> Gauge:
+    '''Gauge over every field of a stats dataclass, labelled by field name.'''
+    return Gauge(name, help, lambda: [((field,), value) for field, value in asdict(stats).items()], ("stat",))
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets))
+        # One slot per bucket plus +Inf; cumulated only when rendered
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self._counts[bisect_left(self.buckets, value)] += 1
+        self._sum += value
+
+    @asynccontextmanager
+    async def time(self):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start)
+
+    def samples(self):
+        total = 0
+        for bound, count in zip(self.buckets, self._counts):
+            total += count
+            yield "_bucket", ("le",), (repr(bound),), total
+        total += self._counts[-1]
+        yield "_bucket", ("le",), ("+Inf",), total
+        yield "_count", (), (), total
+        yield "_sum", (), (), self._sum
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+
+registry = Registry()
+
+room_messages = registry.register(Counter(
+    "mpv_sync_room_messages", "Messages received from room masters", ("room",)
+))
+fanout_seconds = registry.register(Histogram(
+    "mpv_sync_fanout_seconds", "Time from queueing a frame for a member until it was sent"
+))
+send_failures = registry.register(Counter(
+    "mpv_sync_send_failures", "Member sockets dropped by their outbound writer", ("reason",)
+))
+ingress_limited = registry.register(Counter(
+    "mpv_sync_ingress_limited", "Master messages over their rate limit, by action taken", ("action",)
+))
+direct_sends = registry.register(Counter(
+    "mpv_sync_direct_sends", "Frames sent to a single member, e.g. snapshots"
+))
+db_session_seconds = registry.register(Histogram(
+    "mpv_sync_db_session_seconds", "Lifetime of database sessions opened through session_context"
+))
+loop_lag_seconds = registry.register(Histogram(
+    "mpv_sync_event_loop_lag_seconds", "How late the event loop woke a sleeping task"
+))
+process_cpu_seconds = registry.register(Gauge(
+    "mpv_sync_process_cpu_seconds", "CPU time used by this worker process", lambda: [((), process_time())]
+))
+
+
+async def monitor_loop_lag(interval: Optional[float] = None) -> None:
+    interval = settings.metrics_loop_lag_interval if interval is None else interval
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        loop_lag_seconds.observe(max(0.0, loop.time() - start - interval))
+
+
+router = APIRouter()
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -1,5 +1,6 @@
 from contextlib import asynccontextmanager
 from src.database import Session, get_async_engine
+from src.metrics import db_session_seconds
 
 
 class Program:
@@ -8,8 +9,9 @@ class Program:
     
     @asynccontextmanager
     async def session_context(self):
-        async with Session(self._engine) as session:
-            yield session
+        async with db_session_seconds.time():
+            async with Session(self._engine) as session:
+                yield session
 
 program = None
 
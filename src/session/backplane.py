@@ -0,0 +1,262 @@
+import asyncio
+from json import dumps, loads
+from typing import Any, Awaitable, Callable, Optional
+from uuid import uuid4
+from src.config import settings
+from src.log import logger
+
+Handler = Callable[[str, dict], Awaitable[None]]
+
+
+class Backplane:
+    '''Topic based pub/sub between server workers.
+
+    A worker subscribes to topics and gets every payload that another worker
+    publishes on them; its own publishes are never echoed back. A publish
+    with `retain` set is also kept by the backplane under that key and
+    replayed to later subscribers of the topic; publishing None under the
+    same key forgets it. `publish` never waits, so it is safe on the
+    playback hot path.
+    '''
+    def __init__(self):
+        self.worker_id = uuid4().hex
+        self._handler: Optional[Handler] = None
+
+    async def start(self, handler: Handler) -> None:
+        self._handler = handler
+
+    async def stop(self) -> None:
+        self._handler = None
+
+    def subscribe(self, topic: str) -> None:
+        raise NotImplementedError
+
+    def unsubscribe(self, topic: str) -> None:
+        raise NotImplementedError
+
+    def publish(self, topic: str, payload: Optional[dict], retain: Optional[str] = None) -> None:
+        raise NotImplementedError
+
+
+class InProcessHub:
+    '''Shared state of the in-process backplanes that can see each other.'''
+    def __init__(self):
+        self.members: list["InProcessBackplane"] = []
+        self.retained: dict[str, dict[str, dict]] = {}
+
+
+class InProcessBackplane(Backplane):
+    '''Backplane between several RoomManagers in one process, mainly for tests.'''
+    default_hub = InProcessHub()
+
+    def __init__(self, hub: Optional[InProcessHub] = None):
+        super().__init__()
+        self.hub = self.default_hub if hub is None else hub
+        self.topics: set[str] = set()
+        self._inbox: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, handler: Handler) -> None:
+        await super().start(handler)
+        self.hub.members.append(self)
+        self._task = asyncio.create_task(self._consume())
+
+    async def stop(self) -> None:
+        if self in self.hub.members:
+            self.hub.members.remove(self)
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await super().stop()
+
+    def subscribe(self, topic: str) -> None:
+        if topic in self.topics:
+            return
+        self.topics.add(topic)
+        for payload in self.hub.retained.get(topic, {}).values():
+            self._inbox.put_nowait((topic, payload))
+
+    def unsubscribe(self, topic: str) -> None:
+        self.topics.discard(topic)
+
+    def publish(self, topic: str, payload: Optional[dict], retain: Optional[str] = None) -> None:
+        if retain is not None:
+            retained = self.hub.retained.setdefault(topic, {})
+            if payload is None:
+                retained.pop(retain, None)
+            else:
+                retained[retain] = payload
+        if payload is None:
+            return
+        for member in self.hub.members:
+            if member is not self and topic in member.topics:
+                member._inbox.put_nowait((topic, payload))
+
+    async def _consume(self) -> None:
+        while True:
+            topic, payload = await self._inbox.get()
+            try:
+                await self._handler(topic, payload)
+            except Exception as e:
+                logger.exception(f"Backplane handler failed on {topic}: {e}")
+
+
+def _encode_line(op: str, topic: str, payload: Any = None, retain: Optional[str] = None) -> bytes:
+    return dumps({"op": op, "topic": topic, "payload": payload, "retain": retain}).encode() + b"\n"
+
+
+def _split_address(address: str) -> tuple[str, int]:
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+class SocketBackplane(Backplane):
+    '''Backplane client talking to a `BackplaneBroker` over a local TCP socket.
+
+    Frames are newline separated JSON objects. Subscriptions are replayed
+    when the connection to the broker is re-established.
+    '''
+    RECONNECT_DELAY = 1.0
+
+    def __init__(self, address: Optional[str] = None):
+        super().__init__()
+        self.address = settings.backplane_address if address is None else address
+        self.topics: set[str] = set()
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._task: Optional[asyncio.Task] = None
+        self._connected = asyncio.Event()
+
+    async def start(self, handler: Handler) -> None:
+        await super().start(handler)
+        self._task = asyncio.create_task(self._run())
+        await self._connected.wait()
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        await super().stop()
+
+    def _send(self, line: bytes) -> None:
+        # Dropped while disconnected; subscriptions are replayed on reconnect
+        if self._writer is not None:
+            self._writer.write(line)
+
+    def subscribe(self, topic: str) -> None:
+        if topic not in self.topics:
+            self.topics.add(topic)
+            self._send(_encode_line("sub", topic))
+
+    def unsubscribe(self, topic: str) -> None:
+        if topic in self.topics:
+            self.topics.discard(topic)
+            self._send(_encode_line("unsub", topic))
+
+    def publish(self, topic: str, payload: Optional[dict], retain: Optional[str] = None) -> None:
+        self._send(_encode_line("pub", topic, payload, retain))
+
+    async def _run(self) -> None:
+        host, port = _split_address(self.address)
+        while True:
+            try:
+                reader, writer = await asyncio.open_connection(host, port)
+            except OSError as e:
+                logger.warning(f"Backplane broker at {self.address} unreachable: {e}")
+                await asyncio.sleep(self.RECONNECT_DELAY)
+                continue
+            self._writer = writer
+            for topic in self.topics:
+                writer.write(_encode_line("sub", topic))
+            self._connected.set()
+            try:
+                while line := await reader.readline():
+                    message = loads(line)
+                    try:
+                        await self._handler(message["topic"], message["payload"])
+                    except Exception as e:
+                        logger.exception(f"Backplane handler failed on {message['topic']}: {e}")
+            except (OSError, ValueError) as e:
+                logger.warning(f"Backplane connection lost: {e}")
+            finally:
+                self._writer = None
+                writer.close()
+            await asyncio.sleep(self.RECONNECT_DELAY)
+
+
+class BackplaneBroker:
+    '''Relays payloads between `SocketBackplane` clients and keeps retained ones.'''
+    def __init__(self, address: Optional[str] = None):
+        self.address = settings.backplane_address if address is None else address
+        self.subscribers: dict[str, set[asyncio.StreamWriter]] = {}
+        self.retained: dict[str, dict[str, Any]] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> None:
+        host, port = _split_address(self.address)
+        self._server = await asyncio.start_server(self._serve, host, port)
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def serve_forever(self) -> None:
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while line := await reader.readline():
+                message = loads(line)
+                op, topic = message["op"], message["topic"]
+                if op == "sub":
+                    self.subscribers.setdefault(topic, set()).add(writer)
+                    for payload in self.retained.get(topic, {}).values():
+                        writer.write(_encode_line("msg", topic, payload))
+                elif op == "unsub":
+                    self.subscribers.get(topic, set()).discard(writer)
+                elif op == "pub":
+                    self._publish(writer, topic, message["payload"], message.get("retain"))
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Backplane client dropped: {e}")
+        finally:
+            for writers in self.subscribers.values():
+                writers.discard(writer)
+            writer.close()
+
+    def _publish(self, sender: asyncio.StreamWriter, topic: str, payload: Any, retain: Optional[str]) -> None:
+        if retain is not None:
+            retained = self.retained.setdefault(topic, {})
+            if payload is None:
+                retained.pop(retain, None)
+            else:
+                retained[retain] = payload
+        if payload is None:
+            return
+        line = _encode_line("msg", topic, payload)
+        for writer in self.subscribers.get(topic, ()):
+            if writer is not sender:
+                writer.write(line)
+
+
+def create_backplane() -> Optional[Backplane]:
+    if settings.backplane == "inprocess":
+        return InProcessBackplane()
+    if settings.backplane == "socket":
+        return SocketBackplane()
+    return None
+
+
+def run_broker(address: Optional[str] = None) -> None:
+    asyncio.run(BackplaneBroker(address).serve_forever())
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="mpv-sync backplane broker")
+    parser.add_argument("--address", default=None, help="host:port to listen on")
+    run_broker(parser.parse_args().address)
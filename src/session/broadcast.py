@@ -0,0 +1,164 @@
+import asyncio
+from itertools import count, islice
+from time import monotonic
+from typing import Callable, Hashable, Literal, Optional
+from fastapi import WebSocket
+from src.config import settings
+from src.metrics import fanout_seconds, send_failures
+from .frame import Frame
+
+OverflowPolicy = Literal["disconnect", "drop_oldest"]
+
+
+class MemberOutbound:
+    '''Bounded outbound queue and writer task for one member socket.
+
+    Frames put with the same key replace each other, so only the newest value
+    of a property is ever sent. Each send is bounded by `send_timeout`; a send
+    that fails or times out, or a queue that stays over `high_water` for more
+    than `high_water_grace` seconds under the "disconnect" policy, closes the
+    socket and reports the member through `on_drop`.
+
+    With a `batch_window`, the writer waits that long after the first frame
+    of a burst and sends everything queued by then, up to `batch_max`
+    frames, as one batch frame.
+    '''
+    def __init__(
+        self,
+        user_id: int,
+        socket: WebSocket,
+        on_drop: Callable[["MemberOutbound", str], None],
+        *,
+        maxsize: Optional[int] = None,
+        high_water: Optional[int] = None,
+        high_water_grace: Optional[float] = None,
+        policy: Optional[OverflowPolicy] = None,
+        send_timeout: Optional[float] = None,
+        batch_window: Optional[float] = None,
+        batch_max: Optional[int] = None,
+    ):
+        self.user_id = user_id
+        self.socket = socket
+        self._on_drop = on_drop
+        self.maxsize = settings.outbound_queue_size if maxsize is None else maxsize
+        self.high_water = settings.outbound_high_water if high_water is None else high_water
+        self.high_water_grace = settings.outbound_high_water_grace if high_water_grace is None else high_water_grace
+        self.policy = settings.outbound_overflow_policy if policy is None else policy
+        self.send_timeout = settings.broadcast_send_timeout if send_timeout is None else send_timeout
+        self.batch_window = settings.outbound_batch_window if batch_window is None else batch_window
+        self.batch_max = settings.outbound_batch_max if batch_max is None else batch_max
+
+        # Frames with the time they were queued
+        self._pending: dict[Hashable, tuple[Frame, float]] = {}
+        self._seq = count()
+        self._wakeup = asyncio.Event()
+        # Serializes the writer with send_now
+        self._send_lock = asyncio.Lock()
+        self._over_since: Optional[float] = None
+        self._drop_reason: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+        self.closed = False
+
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.batches = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._writer())
+
+    def stop(self) -> None:
+        self.closed = True
+        self._pending.clear()
+        if self._task is not None and self._task is not asyncio.current_task():
+            self._task.cancel()
+
+    def put(self, frame: Frame, key: Optional[Hashable] = None) -> bool:
+        if self.closed:
+            return False
+        if key is None:
+            # Plain ints never collide with the tuple keys used for coalescing
+            key = next(self._seq)
+        elif self._pending.pop(key, None) is not None:
+            self.coalesced += 1
+        self._pending[key] = (frame, monotonic())
+        self._wakeup.set()
+        self._check_pressure()
+        return not self.closed
+
+    async def send_now(self, frame: Frame) -> None:
+        '''Send past the queue, for frames whose send time matters, like clock sync pings.'''
+        if self.closed:
+            return
+        async with self._send_lock:
+            await asyncio.wait_for(self.socket.send_text(frame.text), self.send_timeout)
+
+    def _check_pressure(self) -> None:
+        depth = len(self._pending)
+        if depth > self.maxsize:
+            if self.policy == "disconnect":
+                self._overflow(f"outbound queue full ({depth} frames)")
+                return
+            del self._pending[next(iter(self._pending))]
+            self.dropped += 1
+        if depth <= self.high_water:
+            self._over_since = None
+            return
+        now = monotonic()
+        if self._over_since is None:
+            self._over_since = now
+        elif self.policy == "disconnect" and now - self._over_since > self.high_water_grace:
+            self._overflow(f"outbound queue over high-water mark for {now - self._over_since:.1f}s")
+
+    def _overflow(self, reason: str) -> None:
+        self._drop_reason = reason
+        self.closed = True
+        self._pending.clear()
+        self._wakeup.set()
+
+    async def _writer(self) -> None:
+        try:
+            while not self.closed:
+                if not self._pending:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                take = 1
+                if self.batch_window > 0:
+                    if len(self._pending) < self.batch_max:
+                        await asyncio.sleep(self.batch_window)
+                        if self.closed:
+                            break
+                    take = self.batch_max
+                batch = [self._pending.pop(key) for key in list(islice(self._pending, take))]
+                if len(self._pending) <= self.high_water:
+                    self._over_since = None
+                if len(batch) == 1:
+                    frame = batch[0][0]
+                else:
+                    frame = Frame.batch(frame for frame, _ in batch)
+                    self.batches += 1
+                async with self._send_lock:
+                    await asyncio.wait_for(self.socket.send_text(frame.text), self.send_timeout)
+                now = monotonic()
+                for _, queued_at in batch:
+                    fanout_seconds.observe(now - queued_at)
+                self.sent += len(batch)
+            reason, kind = self._drop_reason, "overflow"
+        except asyncio.TimeoutError:
+            reason, kind = "send timed out", "timeout"
+        except Exception as e:
+            reason, kind = f"send failed: {e}", "error"
+        self.closed = True
+        self._pending.clear()
+        if reason is None:
+            return
+        send_failures.labels(kind)[0] += 1
+        try:
+            await asyncio.wait_for(self.socket.close(code=1011, reason=reason), self.send_timeout)
+        except Exception:
+            pass
+        self._on_drop(self, reason)
@@ -0,0 +1,54 @@
+from typing import Optional
+
+
+class PlaybackClock:
+    '''Model of the master's playback position.
+
+    The position is anchored at the time it was last reported and advanced
+    at `speed` while playing, so it can be read at any later time without a
+    fresh `pos` update from the master. Times are seconds on the same wall
+    clock as `get_system_time`.
+    '''
+    __slots__ = ("position", "anchor", "speed", "paused", "duration")
+
+    def __init__(self):
+        self.position: Optional[float] = None
+        self.anchor: Optional[float] = None
+        self.speed: float = 1.0
+        self.paused: bool = True
+        self.duration: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return not self.paused and self.position is not None
+
+    def position_at(self, now: float) -> Optional[float]:
+        if self.position is None:
+            return None
+        if self.paused or self.anchor is None:
+            return self.position
+        pos = self.position + max(now - self.anchor, 0.0) * self.speed
+        if self.duration:
+            pos = min(pos, self.duration)
+        return pos
+
+    def _rebase(self, at: float) -> None:
+        # Fold elapsed play time into the position before changing the rate
+        self.position = self.position_at(at)
+        self.anchor = at
+
+    def set_position(self, position: float, at: float) -> None:
+        self.position = position
+        self.anchor = at
+
+    def set_paused(self, paused: bool, at: float) -> None:
+        if paused == self.paused:
+            return
+        self._rebase(at)
+        self.paused = paused
+
+    def set_speed(self, speed: float, at: float) -> None:
+        if speed == self.speed:
+            return
+        self._rebase(at)
+        self.speed = speed
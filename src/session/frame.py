@@ -0,0 +1,47 @@
+from dataclasses import dataclass
+from json import dumps
+from typing import Any, Iterable, Optional
+from src.metrics import registry, stats_gauge
+
+
+@dataclass
+class FrameStats:
+    encodes: int = 0
+    avoided: int = 0
+
+
+frame_stats = FrameStats()
+registry.register(stats_gauge(
+    "mpv_sync_frame_encodes", "Outgoing frames encoded, and encodes avoided by sharing a frame", frame_stats
+))
+
+
+BATCH_PREFIX = '{"command": "batch", "extra": {"messages": ['
+BATCH_SUFFIX = ']}}'
+
+
+@dataclass(frozen=True, slots=True)
+class Frame:
+    '''An outgoing message that has already been encoded to JSON text.
+
+    A frame is encoded once and then shared by every recipient of the same
+    event; `frame_stats` counts encodes done and encodes avoided. A batch
+    frame keeps the texts of its messages in `parts`.
+    '''
+    text: str
+    parts: Optional[tuple[str, ...]] = None
+
+    @classmethod
+    def encode(cls, payload: Any) -> "Frame":
+        frame_stats.encodes += 1
+        return cls(dumps(payload))
+
+    @classmethod
+    def batch(cls, frames: Iterable["Frame"]) -> "Frame":
+        '''Join already encoded frames into one batch frame without re-encoding them.'''
+        parts = tuple(part for frame in frames for part in (frame.parts or (frame.text,)))
+        return cls(BATCH_PREFIX + ", ".join(parts) + BATCH_SUFFIX, parts)
+
+    def reuse(self, times: int = 1) -> "Frame":
+        frame_stats.avoided += times
+        return self
@@ -0,0 +1,232 @@
+import asyncio
+from dataclasses import dataclass
+from time import monotonic
+from typing import Awaitable, Callable, Literal, Optional
+from src.config import settings
+from src.log import logger
+from src.metrics import ingress_limited
+from .message import Message
+from .room import State
+
+IngressAction = Literal["drop", "coalesce", "disconnect"]
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = monotonic()
+
+    def _refill(self, now: float) -> None:
+        # `now` may predate the bucket when one is created mid batch
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def ready(self, now: float, cost: int = 1) -> bool:
+        if self.rate <= 0:
+            return True
+        self._refill(now)
+        # A cost above the burst waits for a full bucket and leaves it in debt
+        return self.tokens >= min(cost, self.burst)
+
+    def consume(self, cost: int = 1) -> None:
+        if self.rate > 0:
+            self.tokens -= cost
+
+    def delay(self, now: float, cost: int = 1) -> float:
+        '''Seconds until `cost` tokens are available.'''
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        return max(0.0, (min(cost, self.burst) - self.tokens) / self.rate)
+
+
+class IngressLimitExceeded(Exception):
+    '''Raised by `IngressLimiter.charge` when the action is "disconnect"'''
+
+
+@dataclass
+class IngressStats:
+    accepted: int = 0
+    dropped: int = 0
+    coalesced: int = 0
+    disconnected: int = 0
+
+
+def _items(message: Message) -> list[Message]:
+    return [message] if message.items is None else message.items
+
+
+class IngressLimiter:
+    '''Token-bucket limits on what one master connection may feed into its room.
+
+    Every message needs a token from the connection's bucket and from the
+    bucket of its type (command and name). A batch pays for all of its items
+    up front and is admitted, dropped or held as one unit, so it still
+    applies atomically. Over the limit, `action` decides: "drop" discards the
+    message, "coalesce" holds it and applies it once tokens are available
+    again, "disconnect" makes `submit` return False so the endpoint closes
+    the socket. A held message supersedes what is already waiting for the
+    same state (so a later `seek` replaces a waiting `pos`); a batch it only
+    partly supersedes keeps its other items and is merged with it.
+    '''
+    MAX_TYPES = 64
+
+    def __init__(
+        self,
+        apply: Callable[[Message], Awaitable[None]],
+        *,
+        rate: Optional[float] = None,
+        burst: Optional[float] = None,
+        type_rate: Optional[float] = None,
+        type_burst: Optional[float] = None,
+        action: Optional[IngressAction] = None,
+    ):
+        self._apply = apply
+        rate = settings.ingress_rate if rate is None else rate
+        burst = settings.ingress_burst if burst is None else burst
+        self.type_rate = settings.ingress_type_rate if type_rate is None else type_rate
+        self.type_burst = settings.ingress_type_burst if type_burst is None else type_burst
+        self.action = settings.ingress_action if action is None else action
+        self._connection = TokenBucket(rate, burst)
+        self._types: dict[tuple, TokenBucket] = {}
+        # Over-limit messages waiting for tokens, under every state they write
+        self._pending: dict[object, Message] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self.stats = IngressStats()
+
+    def _bucket(self, key: tuple) -> TokenBucket:
+        bucket = self._types.get(key)
+        if bucket is None:
+            # Names are client controlled, so unknown ones share one bucket past the cap
+            if len(self._types) >= self.MAX_TYPES:
+                key = ("*",)
+                bucket = self._types.get(key)
+            if bucket is None:
+                bucket = self._types[key] = TokenBucket(self.type_rate, self.type_burst)
+        return bucket
+
+    def _costs(self, message: Message) -> dict[TokenBucket, int]:
+        costs: dict[TokenBucket, int] = {}
+        for item in _items(message):
+            bucket = self._bucket((item.command, item.name))
+            costs[bucket] = costs.get(bucket, 0) + 1
+        return costs
+
+    def _take(self, message: Message, now: float) -> bool:
+        count = len(_items(message))
+        costs = self._costs(message)
+        if not self._connection.ready(now, count):
+            return False
+        if not all(bucket.ready(now, cost) for bucket, cost in costs.items()):
+            return False
+        self._connection.consume(count)
+        for bucket, cost in costs.items():
+            bucket.consume(cost)
+        return True
+
+    def _delay(self, message: Message, now: float) -> float:
+        return max(
+            self._connection.delay(now, len(_items(message))),
+            *(bucket.delay(now, cost) for bucket, cost in self._costs(message).items()),
+        )
+
+    @staticmethod
+    def _slot(message: Message):
+        # Messages writing the same State attribute supersede each other, e.g. `pos` and `seek`
+        prop = State.property_for(message)
+        return (message.command, message.name) if prop is None else prop.attr
+
+    def _waiting(self) -> list[Message]:
+        return list({id(message): message for message in self._pending.values()}.values())
+
+    def _hold(self, message: Message) -> None:
+        slots = {self._slot(item) for item in _items(message)}
+        waiting = {id(m): m for slot in slots if (m := self._pending.get(slot)) is not None}
+        if waiting:
+            # Items of waiting messages that this one does not supersede go along with it
+            kept = [
+                item for m in waiting.values() for item in _items(m)
+                if self._slot(item) not in slots
+            ]
+            for slot in [slot for slot, m in self._pending.items() if id(m) in waiting]:
+                del self._pending[slot]
+            if kept:
+                message = Message("batch", items=kept + _items(message))
+        for item in _items(message):
+            self._pending[self._slot(item)] = message
+        self.stats.coalesced += 1
+        ingress_limited.labels("coalesce")[0] += 1
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flusher())
+
+    def charge(self, kind: str) -> bool:
+        '''Charge a frame that never reaches the room, like a pong or a malformed frame.
+
+        Returns whether the caller may handle it (reply, log); such frames are
+        never held. Raises `IngressLimitExceeded` under the "disconnect" action.
+        '''
+        now = monotonic()
+        bucket = self._bucket((kind,))
+        if self._connection.ready(now) and bucket.ready(now):
+            self._connection.consume()
+            bucket.consume()
+            return True
+        if self.action == "disconnect":
+            self.stats.disconnected += 1
+            ingress_limited.labels("disconnect")[0] += 1
+            raise IngressLimitExceeded(kind)
+        self.stats.dropped += 1
+        ingress_limited.labels("drop")[0] += 1
+        return False
+
+    async def submit(self, message: Message) -> bool:
+        if any(self._slot(item) in self._pending for item in _items(message)):
+            # Never let a newer value overtake the one already waiting
+            self._hold(message)
+            return True
+        if self._take(message, monotonic()):
+            self.stats.accepted += 1
+            await self._apply(message)
+            return True
+        if self.action == "disconnect":
+            self.stats.disconnected += 1
+            ingress_limited.labels("disconnect")[0] += 1
+            return False
+        if self.action == "drop":
+            self.stats.dropped += 1
+            ingress_limited.labels("drop")[0] += 1
+            return True
+        self._hold(message)
+        return True
+
+    async def _flusher(self) -> None:
+        try:
+            while self._pending:
+                now = monotonic()
+                await asyncio.sleep(min(self._delay(message, now) for message in self._waiting()))
+                now = monotonic()
+                for message in self._waiting():
+                    # Skip messages superseded while an earlier one was applied
+                    slots = [self._slot(item) for item in _items(message)]
+                    if self._pending.get(slots[0]) is not message or not self._take(message, now):
+                        continue
+                    for slot in slots:
+                        self._pending.pop(slot, None)
+                    self.stats.accepted += 1
+                    try:
+                        await self._apply(message)
+                    except Exception as e:
+                        logger.exception(f"Failed to apply rate limited message: {e}")
+        finally:
+            self._flush_task = None
+
+    def stop(self) -> None:
+        self._pending.clear()
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
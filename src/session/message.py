@@ -0,0 +1,112 @@
+from dataclasses import dataclass
+from json import loads
+from typing import Any, Literal, Optional, Union
+from .frame import Frame
+
+Command = Literal["state", "action", "desc", "req", "pong", "batch"]
+
+COMMANDS: frozenset[str] = frozenset(("state", "action", "desc", "req", "pong", "batch"))
+# Commands that are meaningless without a name
+NAMED_COMMANDS: frozenset[str] = frozenset(("state", "action", "req"))
+# Commands whose payload lives in `extra`
+EXTRA_COMMANDS: frozenset[str] = frozenset(("desc", "pong", "batch"))
+# Commands allowed inside a batch, which carries them in `extra.messages`
+BATCH_ITEM_COMMANDS: frozenset[str] = frozenset(("state", "action", "desc"))
+MAX_BATCH_SIZE = 64
+
+
+class MessageError(Exception):
+    '''Raised when an inbound frame does not match the message schema'''
+    def __init__(self, code: str, detail: str, field: Optional[str] = None):
+        super().__init__(f"{code}: {detail}" if field is None else f"{code} ({field}): {detail}")
+        self.code = code
+        self.detail = detail
+        self.field = field
+
+    def to_dict(self):
+        return {"code": self.code, "field": self.field, "detail": self.detail}
+
+
+@dataclass(slots=True)
+class Message:
+    '''One decoded inbound message.
+
+    `frame` caches the outgoing encoding once the message is broadcast.
+    A batch keeps its decoded messages in `items`.
+    '''
+    command: Command
+    name: Optional[str] = None
+    value: Union[str, int, float, bool, None] = None
+    timestamp: Optional[float] = None
+    extra: Optional[dict[str, Any]] = None
+    frame: Optional[Frame] = None
+    items: Optional[list["Message"]] = None
+
+    def to_dict(self):
+        result = {"command": self.command}
+        if self.name is not None:
+            result["name"] = self.name
+        if self.value is not None:
+            result["value"] = self.value
+        if self.timestamp is not None:
+            result["timestamp"] = self.timestamp
+        if self.items is not None:
+            result["extra"] = {"messages": [item.to_dict() for item in self.items]}
+        elif self.extra is not None:
+            result["extra"] = self.extra
+        return result
+
+
+def decode_message(data: Union[str, bytes, bytearray, dict]) -> Message:
+    '''Parse and validate one inbound frame, raising `MessageError` if it is malformed.'''
+    if isinstance(data, (str, bytes, bytearray)):
+        try:
+            data = loads(data)
+        except ValueError as e:
+            raise MessageError("invalid_json", str(e)) from None
+    if not isinstance(data, dict):
+        raise MessageError("invalid_type", "message must be a JSON object")
+
+    command = data.get("command")
+    if command not in COMMANDS:
+        raise MessageError("unknown_command", f"unknown command {command!r}", "command")
+
+    name = data.get("name")
+    if name is None:
+        if command in NAMED_COMMANDS:
+            raise MessageError("missing_field", f"{command} message needs a name", "name")
+    elif type(name) is not str:
+        raise MessageError("invalid_type", "name must be a string", "name")
+
+    value = data.get("value")
+    if isinstance(value, (dict, list)):
+        raise MessageError("invalid_type", "value must be a scalar", "value")
+
+    timestamp = data.get("timestamp")
+    if timestamp is not None and (type(timestamp) is bool or not isinstance(timestamp, (int, float))):
+        raise MessageError("invalid_type", "timestamp must be a number", "timestamp")
+
+    extra = data.get("extra")
+    if extra is None:
+        if command in EXTRA_COMMANDS:
+            raise MessageError("missing_field", f"{command} message needs extra", "extra")
+    elif type(extra) is not dict:
+        raise MessageError("invalid_type", "extra must be an object", "extra")
+
+    if command == "batch":
+        return Message(command, name, value, timestamp, extra, items=_decode_batch(extra))
+    return Message(command, name, value, timestamp, extra)
+
+
+def _decode_batch(extra: dict) -> list[Message]:
+    messages = extra.get("messages")
+    if type(messages) is not list:
+        raise MessageError("invalid_type", "batch needs a list of messages", "extra.messages")
+    if not messages or len(messages) > MAX_BATCH_SIZE:
+        raise MessageError("invalid_batch", f"batch must hold 1 to {MAX_BATCH_SIZE} messages", "extra.messages")
+    items = []
+    for i, data in enumerate(messages):
+        if type(data) is not dict or data.get("command") not in BATCH_ITEM_COMMANDS:
+            raise MessageError("invalid_batch", "batch items must be state, action or desc messages", f"extra.messages[{i}]")
+        items.append(decode_message(data))
+    return items
@@ -0,0 +1,109 @@
+import asyncio
+from json import dumps, loads
+from typing import TYPE_CHECKING, Optional
+from src.config import settings
+from src.database import RoomModel
+from src.log import logger
+from .room import Room, get_system_time
+
+if TYPE_CHECKING:
+    from src.prog import Program
+
+
+class RoomStore:
+    '''Write-behind persistence of rooms into the SQLite database.
+
+    `mark_dirty` and `mark_deleted` only record the room and wake the flusher,
+    which waits `debounce` seconds so bursts of updates collapse, then
+    snapshots every dirty room and writes them in one transaction. Nothing on
+    the playback path ever waits on disk.
+    '''
+    def __init__(self, program: "Program", debounce: Optional[float] = None):
+        self.program = program
+        self.debounce = settings.persist_debounce if debounce is None else debounce
+        self._dirty: dict[str, Room] = {}
+        self._deleted: set[str] = set()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.rows_written = 0
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._flusher())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            # Let a write cut short by the cancel put its batch back first
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def mark_dirty(self, room: Room) -> None:
+        self._deleted.discard(room.uuid)
+        self._dirty[room.uuid] = room
+        self._wakeup.set()
+
+    def discard(self, uuid: str) -> None:
+        # The room is now persisted by another worker
+        self._dirty.pop(uuid, None)
+
+    def mark_deleted(self, uuid: str) -> None:
+        self._dirty.pop(uuid, None)
+        self._deleted.add(uuid)
+        self._wakeup.set()
+
+    async def load_all(self) -> list[RoomModel]:
+        async with self.program.session_context() as session:
+            return await session.room.get_by(fetch_all=True)
+
+    @staticmethod
+    def to_model(room: Room, now: float) -> RoomModel:
+        return RoomModel(
+            uuid=room.uuid,
+            name=room.name,
+            master_id=room.master.id,
+            master_name=room.master.name,
+            members=dumps([[member.id, member.name] for member in room.members.values()]),
+            state=dumps(room.state.to_record()),
+            description=dumps(room.description.to_record()),
+            updated_at=now,
+        )
+
+    @staticmethod
+    def load_into(room: Room, model: RoomModel) -> None:
+        room.state.load_record(loads(model.state))
+        room.description.load_record(loads(model.description))
+
+    async def flush(self) -> None:
+        if not self._dirty and not self._deleted:
+            return
+        now = get_system_time()
+        # Snapshot in memory first; the rooms keep changing while we write
+        dirty, deleted = self._dirty, self._deleted
+        self._dirty, self._deleted = {}, set()
+        models = [self.to_model(room, now) for room in dirty.values()]
+        try:
+            async with self.program.session_context() as session:
+                await session.room.upsert_many(models)
+                await session.room.delete_many("uuid", deleted)
+                await session.commit()
+        except BaseException:
+            # Retry with the next flush, unless newer changes superseded them; also when cancelled
+            for uuid, room in dirty.items():
+                if uuid not in self._deleted:
+                    self._dirty.setdefault(uuid, room)
+            self._deleted |= deleted - self._dirty.keys()
+            raise
+        self.flushes += 1
+        self.rows_written += len(models) + len(deleted)
+
+    async def _flusher(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(self.debounce)
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.exception(f"Failed to persist rooms: {e}")
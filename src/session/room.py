@@ -1,11 +1,28 @@
-from json import dumps
+import asyncio
+import secrets
+from collections import deque
 from datetime import datetime
-from typing import TYPE_CHECKING, Literal, Union
+from enum import Enum
+from json import loads
+from time import monotonic
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, ClassVar, Optional, Union
 from fastapi import WebSocket, APIRouter, Response, HTTPException
 from uuid import uuid4
 from src.user import User, get_user_by_name
 from src.jwt import JWTError, verify_token
 from src.log import logger
+from src.config import settings
+from src.metrics import Gauge, direct_sends, registry, room_messages
+from .broadcast import MemberOutbound
+from .frame import Frame
+from .clock import PlaybackClock
+from .timesync import ClockSync
+from .message import Message, decode_message
+from .backplane import Backplane
+
+if TYPE_CHECKING:
+    from .persist import RoomStore
 
 router = APIRouter(prefix="/room")
 
@@ -39,275 +56,804 @@ def or_none(val):
         return None
     return val
 
-class _MessageTypes:
-    if TYPE_CHECKING:
-        command: Literal[
-            "state", "action", "desc",
-            "req",
-        ]
-        name: Literal[
-            "stop",
-            "enabled",
-            "pause", "paused-for-cache", "volume", "ao-mute", "mute", "speed", "sub-delay", "audio-delay",
-            "seek",
-            "pos",
-            "master",
-            "slave"
-        ]
-        value: Union[str, int, float, bool]
-        extra: "MessageWrap"
-
-        filename: str
-        filesize: int
-        duration: int
-        pos: float
-        
-        timestamp: float
-
-class MessageWrap(_MessageTypes):
-    def __init__(self, message: dict):
-        self._message = message
-    
-    def to_dict(self):
-        return self._message
-    
-    def __getattr__(self, name):
-        try:
-            val = self._message[name]
-            if isinstance(val, dict):
-                return MessageWrap(val)
-            else:
-                return val
-        except KeyError:
-            return _Unset
-
 class Description:
     filename: str = _Unset
     filesize: int = _Unset
     duration: int = _Unset
     start_pos: float = _Unset
 
-    def to_dict(self):
+    def __init__(self):
+        # Bumped by every update; the cached snapshot is rebuilt when it moves
+        self.version = 0
+        self._snapshot: Optional[Frame] = None
+        self._snapshot_version = -1
+
+    def to_dict(self, now: Optional[float] = None):
+        if now is None:
+            now = get_system_time()
         return {
-            "filename": {"value": or_none(self.filename) , "timestamp_server": get_system_time(), "req": True},
-            "filesize": {"value": or_none(self.filesize) , "timestamp_server": get_system_time(), "req": True},
-            "duration": {"value": or_none(self.duration) , "timestamp_server": get_system_time(), "req": True},
-            "pos":      {"value": or_none(self.start_pos), "timestamp_server": get_system_time(), "req": True}
+            "filename": {"value": or_none(self.filename) , "timestamp_server": now, "req": True},
+            "filesize": {"value": or_none(self.filesize) , "timestamp_server": now, "req": True},
+            "duration": {"value": or_none(self.duration) , "timestamp_server": now, "req": True},
+            "pos":      {"value": or_none(self.start_pos), "timestamp_server": now, "req": True}
         }
-    
-    def update(self, message: MessageWrap) -> None:
-        self.filename = message.extra.filename
-        self.filesize = message.extra.filesize
-        self.duration = message.extra.duration
-        self.start_pos = message.extra.pos
 
-class State:
-    paused: bool = _Unset
-    position: float = _Unset
-    volume: int = _Unset
-    ao_mute: bool = _Unset
-    mute: bool = _Unset
-    speed: int = _Unset
-
-    sub_delay: int = _Unset
-    audio_delay: int = _Unset
-
-    _paused_timestamp: float = _Unset
-    _position_timestamp: float = _Unset
-    _volume_timestamp: float = _Unset
-    _ao_mute_timestamp: float = _Unset
-    _mute_timestamp: float = _Unset
-    _speed_timestamp: float = _Unset
-    _sub_delay_timestamp: float = _Unset
-    _audio_delay_timestamp: float = _Unset
-
-    def to_dict(self):
+    def snapshot(self) -> Frame:
+        if self._snapshot is not None and self._snapshot_version == self.version:
+            return self._snapshot.reuse()
+        self._snapshot = Frame.encode({"command": "req", "extra": self.to_dict()})
+        self._snapshot_version = self.version
+        return self._snapshot
+    
+    def to_record(self) -> dict:
         return {
-            "pause":        {"value": or_none(self.paused),      "timestamp_server": get_system_time(), "timestamp": or_none(self._paused_timestamp),        "req": True},
-            "pos":          {"value": or_none(self.position),    "timestamp_server": get_system_time(), "timestamp": or_none(self._position_timestamp),      "req": True},
-            "volume":       {"value": or_none(self.volume),      "timestamp_server": get_system_time(), "timestamp": or_none(self._volume_timestamp),        "req": True},
-            "ao_mute":      {"value": or_none(self.ao_mute),     "timestamp_server": get_system_time(), "timestamp": or_none(self._ao_mute_timestamp),       "req": True},
-            "mute":         {"value": or_none(self.mute),        "timestamp_server": get_system_time(), "timestamp": or_none(self._mute_timestamp),          "req": True},
-            "speed":        {"value": or_none(self.speed),       "timestamp_server": get_system_time(), "timestamp": or_none(self._speed_timestamp),         "req": True},
-            "sub_delay":    {"value": or_none(self.sub_delay),   "timestamp_server": get_system_time(), "timestamp": or_none(self._sub_delay_timestamp),     "req": True},
-            "audio_delay":  {"value": or_none(self.audio_delay), "timestamp_server": get_system_time(), "timestamp": or_none(self._audio_delay_timestamp),   "req": True}
+            "filename": or_none(self.filename),
+            "filesize": or_none(self.filesize),
+            "duration": or_none(self.duration),
+            "start_pos": or_none(self.start_pos),
         }
 
-    def update(self, message: MessageWrap) -> None:
-        def type_check(val, tp):
-            if not isinstance(val, tp):
-                try:
-                    if tp in [int, float]:
-                        # string to int or float
-                        val = tp(val)
-                        return val
-                except Exception:
-                    pass
-                raise TypeError(f"Expected {tp}, got {type(val)}")
+    def load_record(self, record: dict) -> None:
+        self.version += 1
+        for field in ("filename", "filesize", "duration", "start_pos"):
+            value = record.get(field)
+            setattr(self, field, _Unset if value is None else value)
+
+    def update(self, message: Message) -> None:
+        self.version += 1
+        extra = message.extra
+        self.filename = extra.get("filename", _Unset)
+        self.filesize = extra.get("filesize", _Unset)
+        self.duration = extra.get("duration", _Unset)
+        self.start_pos = extra.get("pos", _Unset)
+
+def _coerce_bool(val):
+    if not isinstance(val, bool):
+        raise TypeError(f"Expected {bool}, got {type(val)}")
+    return val
+
+def _coerce_number(tp):
+    def coerce(val):
+        if isinstance(val, tp) and not isinstance(val, bool):
             return val
+        # string, int or float to the declared numeric type
         try:
-            if message.name == _Unset:
-                logger.warning(f"Invalid received message: {message}")
-                return False
-            if message.command == "state":
-                if message.name in ["pause", "paused-for-cache"]:
-                    val = type_check(message.value, bool)
-                    self._paused_timestamp = message.timestamp
-                    if self.paused == val:
-                        return True
-                    self.paused = val
-                elif message.name == "volume":
-                    val = type_check(message.value, int)
-                    self._volume_timestamp = message.timestamp
-                    if self.volume == val:
-                        return False
-                    self.volume = val
-                elif message.name == "mute":
-                    val = type_check(message.value, bool)
-                    self._mute_timestamp = message.timestamp
-                    if self.mute == val:
-                        return False
-                    self.mute = val
-                elif message.name == "ao-mute":
-                    val = type_check(message.value, bool)
-                    self._ao_mute_timestamp = message.timestamp
-                    if self.ao_mute == val:
-                        return False
-                    self.ao_mute = val
-                elif message.name == "speed":
-                    val = type_check(message.value, int)
-                    self._speed_timestamp = message.timestamp
-                    if self.speed == val:
-                        return False
-                    self.speed = val
-                elif message.name == "sub-delay":
-                    val = type_check(message.value, int)
-                    self._sub_delay_timestamp = message.timestamp
-                    if self.sub_delay == val:
-                        return False
-                    self.sub_delay = val
-                elif message.name == "audio-delay":
-                    val = type_check(message.value, int)
-                    self._audio_delay_timestamp = message.timestamp
-                    if self.audio_delay == val:
-                        return False
-                    self.audio_delay = val
-                elif message.name == "pos":
-                    val = type_check(message.value, float)
-                    self._position_timestamp = message.timestamp
-                    if self.position == val:
-                        return True
-                    self.position = val
-            elif message.command == "action":
-                if message.name == "seek":
-                    val = type_check(message.value, float)
-                    self._seek_timestamp = message.timestamp
-                    if self.position == val:
-                        return True
-                    self.position = val
+            return tp(val)
+        except Exception:
+            raise TypeError(f"Expected {tp}, got {type(val)}") from None
+    return coerce
+
+@dataclass(frozen=True, slots=True)
+class StateProperty:
+    '''One mpv property tracked by `State`.
+
+    `attr` and `timestamp_attr` are the `State` slots holding the value and
+    the master's timestamp, `key` is its name in `State.to_dict` (None keeps
+    it out), and `unchanged` is what `State.update` returns when the value
+    did not change. `clock` names the `PlaybackClock` setter it drives.
+    '''
+    command: str
+    names: tuple[str, ...]
+    attr: str
+    coerce: Callable[[Any], Any]
+    timestamp_attr: str
+    key: Optional[str] = None
+    unchanged: bool = False
+    clock: Optional[str] = None
+
+STATE_PROPERTIES: tuple[StateProperty, ...] = (
+    StateProperty("state", ("pause", "paused-for-cache"), "paused", _coerce_bool, "_paused_timestamp", "pause", unchanged=True, clock="set_paused"),
+    StateProperty("state", ("pos",), "position", _coerce_number(float), "_position_timestamp", "pos", unchanged=True, clock="set_position"),
+    StateProperty("state", ("volume",), "volume", _coerce_number(int), "_volume_timestamp", "volume"),
+    StateProperty("state", ("ao-mute",), "ao_mute", _coerce_bool, "_ao_mute_timestamp", "ao_mute"),
+    StateProperty("state", ("mute",), "mute", _coerce_bool, "_mute_timestamp", "mute"),
+    StateProperty("state", ("speed",), "speed", _coerce_number(float), "_speed_timestamp", "speed", clock="set_speed"),
+    StateProperty("state", ("sub-delay",), "sub_delay", _coerce_number(float), "_sub_delay_timestamp", "sub_delay"),
+    StateProperty("state", ("audio-delay",), "audio_delay", _coerce_number(float), "_audio_delay_timestamp", "audio_delay"),
+    StateProperty("action", ("seek",), "position", _coerce_number(float), "_seek_timestamp", unchanged=True, clock="set_position"),
+)
+
+class State:
+    # Dispatch and slot layout are derived from STATE_PROPERTIES; add new properties there
+    _dispatch: ClassVar[dict[tuple[str, str], StateProperty]] = {
+        (prop.command, name): prop for prop in STATE_PROPERTIES for name in prop.names
+    }
+    _reported: ClassVar[tuple[StateProperty, ...]] = tuple(prop for prop in STATE_PROPERTIES if prop.key)
+    _value_slots: ClassVar[tuple[str, ...]] = tuple(dict.fromkeys(
+        slot for prop in STATE_PROPERTIES for slot in (prop.attr, prop.timestamp_attr)
+    ))
+    __slots__ = ("clock", "version", "_snapshot", "_snapshot_version", "_snapshot_time", *_value_slots)
+
+    if TYPE_CHECKING:
+        paused: bool
+        position: float
+        volume: int
+        ao_mute: bool
+        mute: bool
+        speed: float
+        sub_delay: float
+        audio_delay: float
+
+    def __init__(self):
+        for slot in self._value_slots:
+            setattr(self, slot, _Unset)
+        self.clock = PlaybackClock()
+        self.version = 0
+        self._snapshot: Optional[Frame] = None
+        self._snapshot_version = -1
+        self._snapshot_time = 0.0
+
+    @classmethod
+    def property_for(cls, message: Message) -> Optional[StateProperty]:
+        return cls._dispatch.get((message.command, message.name))
+
+    def position_at(self, now: float):
+        return self.clock.position_at(now)
+
+    def to_dict(self, now: Optional[float] = None):
+        if now is None:
+            now = get_system_time()
+        result = {}
+        for prop in self._reported:
+            if prop.clock == "set_position":
+                value = self.position_at(now)
+                timestamp = None if value is None else now
+            else:
+                value = or_none(getattr(self, prop.attr))
+                timestamp = or_none(getattr(self, prop.timestamp_attr))
+            result[prop.key] = {"value": value, "timestamp_server": now, "timestamp": timestamp, "req": True}
+        return result
+
+    def snapshot(self) -> Frame:
+        now = get_system_time()
+        snap = self._snapshot
+        if (
+            snap is not None
+            and self._snapshot_version == self.version
+            # A running clock makes the extrapolated position go stale
+            and not (self.clock.running and now - self._snapshot_time > settings.state_snapshot_max_age)
+        ):
+            return snap.reuse()
+        self._snapshot = Frame.encode({"command": "req", "extra": self.to_dict(now)})
+        self._snapshot_version = self.version
+        self._snapshot_time = now
+        return self._snapshot
+
+    def to_record(self) -> dict:
+        clock = self.clock
+        return {
+            "values": {slot: or_none(getattr(self, slot)) for slot in self._value_slots},
+            "clock": {
+                "position": clock.position,
+                "anchor": clock.anchor,
+                "speed": clock.speed,
+                "paused": clock.paused,
+                "duration": clock.duration,
+            },
+        }
+
+    def load_record(self, record: dict) -> None:
+        self.version += 1
+        for slot, value in record.get("values", {}).items():
+            if slot in self._value_slots:
+                setattr(self, slot, _Unset if value is None else value)
+        for field, value in record.get("clock", {}).items():
+            if field in PlaybackClock.__slots__:
+                setattr(self.clock, field, value)
+
+    def update(self, message: Message) -> bool:
+        prop = self._dispatch.get((message.command, message.name))
+        if prop is None:
+            # Not tracked, forwarded as is
             return True
+        try:
+            val = prop.coerce(message.value)
         except TypeError as e:
             logger.warning(f"Invalid received message: {e}")
             return False
+        timestamp = message.timestamp
+        # The version only moves on a real write, so repeats keep the cached snapshot
+        stamp = _Unset if timestamp is None else timestamp
+        if getattr(self, prop.timestamp_attr) != stamp:
+            setattr(self, prop.timestamp_attr, stamp)
+            self.version += 1
+        if prop.clock is not None:
+            getattr(self.clock, prop.clock)(val, get_system_time() if timestamp is None else timestamp)
+        if getattr(self, prop.attr) == val:
+            return prop.unchanged
+        setattr(self, prop.attr, val)
+        self.version += 1
+        return True
+
+    @classmethod
+    def validate_batch(cls, messages: list[Message]) -> bool:
+        for message in messages:
+            prop = cls._dispatch.get((message.command, message.name))
+            if prop is None:
+                continue
+            try:
+                prop.coerce(message.value)
+            except TypeError as e:
+                logger.warning(f"Invalid received batch, nothing applied: {e}")
+                return False
+        return True
+
+    def update_batch(self, messages: list[Message]) -> list[Message]:
+        '''Apply several updates together and return those that changed something.
+
+        Every value is validated first, so either the whole batch applies or
+        none of it does; nothing can observe the state half way through.
+        '''
+        if not self.validate_batch(messages):
+            return []
+        return [message for message in messages if self.update(message)]
+
+class RoomStatus(str, Enum):
+    ACTIVE = "active"            # master connected
+    MASTER_GONE = "master_gone"  # members connected, master not
+    IDLE = "idle"                # nobody connected
+    CLOSED = "closed"
+
+@dataclass(slots=True)
+class ResumeSession:
+    user: User
+    # Set once the member's socket is gone
+    expires: Optional[float] = None
 
 class Room:
-    _room_state: str
+    status: RoomStatus
     uuid: str
     name: str
     master: User
-    members: list
+    members: dict[int, User]
     state: State
     description: Description
 
-    def __init__(self, master: User, name: str = "New Room") -> None:
-        self.uuid = uuid4()
+    def __init__(self, master: User, name: str = "New Room", uuid: Optional[str] = None) -> None:
+        self.uuid = str(uuid4()) if uuid is None else uuid
         self.name = name
         self.master = master
-        self.members = [master]
+        self.members = {master.id: master}
+        self.status = RoomStatus.IDLE
+        self.status_since = monotonic()
+        self.last_activity = self.status_since
+        self.master_connected = False
+        # Never reaped, e.g. the shared test room
+        self.keep_alive = False
+        # Announced by another worker, which owns its lifecycle
+        self.replica = False
+        # Other workers with sockets in this room, by worker id, with when they last said so
+        self.remote_presence: dict[str, float] = {}
         self.connected_users: dict[int, WebSocket] = {}
+        self.outbound: dict[int, MemberOutbound] = {}
+        self.clock_syncs: dict[int, ClockSync] = {}
         self.state = State()
         self.description = Description()
+        self._sync_task: Optional[asyncio.Task] = None
+        self.backplane: Optional[Backplane] = None
+        self.store: Optional["RoomStore"] = None
+        self._messages = room_messages.labels(self.uuid)
+        # Recent broadcast events as (seq, coalesce key, frame), replayed to resuming members
+        self.seq = 0
+        self.events: deque[tuple[int, Any, Frame]] = deque(maxlen=settings.resume_buffer_size)
+        self.sessions: dict[str, ResumeSession] = {}
+
+    def _changed(self) -> None:
+        if self.store is not None:
+            self.store.mark_dirty(self)
+
+    @property
+    def topic(self) -> str:
+        return f"room:{self.uuid}"
+
+    def info(self) -> dict:
+        return {"uuid": self.uuid, "name": self.name, "master": {"id": self.master.id, "name": self.master.name}}
+
+    def _update_status(self) -> None:
+        if self.status is RoomStatus.CLOSED:
+            return
+        if self.master_connected:
+            status = RoomStatus.ACTIVE
+        elif self.connected_users:
+            status = RoomStatus.MASTER_GONE
+        else:
+            status = RoomStatus.IDLE
+        if status is not self.status:
+            self.status = status
+            self.status_since = monotonic()
+            self.announce_presence()
+
+    def announce_presence(self) -> None:
+        # Tells the other workers, above all the owner, whether this worker holds sockets of the room
+        if self.backplane is not None and self.status is not RoomStatus.CLOSED:
+            self.backplane.publish(self.topic, {
+                "presence": self.backplane.worker_id,
+                "connected": len(self.connected_users) + self.master_connected,
+            })
+
+    def _on_presence(self, payload: dict) -> None:
+        self.last_activity = monotonic()
+        if payload["connected"]:
+            self.remote_presence[payload["presence"]] = self.last_activity
+        else:
+            self.remote_presence.pop(payload["presence"], None)
+
+    def expired(self, now: float) -> bool:
+        if self.keep_alive or self.replica:
+            return False
+        # Workers repeat their presence every reap interval; a silent one has gone away
+        ttl = 3 * settings.room_reap_interval
+        for worker_id, seen in list(self.remote_presence.items()):
+            if now - seen > ttl:
+                del self.remote_presence[worker_id]
+        if self.remote_presence:
+            return False
+        quiet = now - max(self.status_since, self.last_activity)
+        if self.status is RoomStatus.IDLE:
+            return quiet > settings.room_idle_timeout
+        if self.status is RoomStatus.MASTER_GONE:
+            return quiet > settings.room_master_gone_timeout
+        return False
+
+    def attach_master(self) -> None:
+        self.master_connected = True
+        self._update_status()
+
+    def detach_master(self) -> None:
+        self.master_connected = False
+        self._update_status()
 
     def add_member(self, member: User) -> None:
-        self.members.append(member)
+        if member.id not in self.members:
+            self.members[member.id] = member
+            self._changed()
     
     def remove_member(self, member: User) -> None:
         if member.id == self.master.id:
             raise ValueError("Cannot remove master from room")
-        self.members.remove(member)
+        if self.members.pop(member.id, None) is not None:
+            self._changed()
     
     def add_connected_socket(self, user_id, connect: WebSocket):
+        self.remove_connected_socket(user_id)
         self.connected_users[user_id] = connect
+        outbound = MemberOutbound(user_id, connect, self._on_outbound_drop)
+        self.outbound[user_id] = outbound
+        outbound.start()
+        if self._sync_task is None and settings.sync_tick_interval > 0:
+            self._sync_task = asyncio.create_task(self._sync_ticker(settings.sync_tick_interval))
+        self._update_status()
     
-    def remove_connected_socket(self, user_id):
+    def remove_connected_socket(self, user_id, connect: Optional[WebSocket] = None) -> bool:
+        # With `connect`, only remove it if the user has not reconnected with another socket
+        if connect is not None and self.connected_users.get(user_id) is not connect:
+            return False
         self.connected_users.pop(user_id, None)
+        outbound = self.outbound.pop(user_id, None)
+        if outbound is not None:
+            outbound.stop()
+        if not self.outbound and self._sync_task is not None:
+            self._sync_task.cancel()
+            self._sync_task = None
+        self._update_status()
+        return True
+
+    def connect_member(self, user: User, connect: WebSocket, resume_seq: Optional[int] = None) -> str:
+        '''Attach a member socket and return the token it can resume with.
+
+        The member first gets `{"command": "session", "seq", "extra": {"token"}}`.
+        With `resume_seq`, the last seq it saw, it then gets the events it
+        missed in one batch, or fresh snapshots if the buffer no longer
+        reaches back that far. Nothing can be broadcast in between, so no
+        event is lost or duplicated.
+        '''
+        self.add_member(user)
+        self.add_connected_socket(user.id, connect)
+        token = self.open_session(user)
+        outbound = self.outbound[user.id]
+        outbound.put(Frame.encode({"command": "session", "seq": self.seq, "extra": {"token": token}}))
+        if resume_seq is not None:
+            missed = self.events_since(resume_seq)
+            if missed is None:
+                outbound.put(self.description.snapshot())
+                outbound.put(self.state.snapshot())
+            elif missed:
+                outbound.put(missed[0] if len(missed) == 1 else Frame.batch(missed))
+        return token
+
+    def open_session(self, user: User) -> str:
+        token = secrets.token_urlsafe(24)
+        self.sessions[token] = ResumeSession(user)
+        return token
+
+    def suspend_session(self, token: str) -> None:
+        session = self.sessions.get(token)
+        if session is not None:
+            session.expires = monotonic() + settings.resume_ttl
+
+    def resume_session(self, token: str) -> Optional[User]:
+        # Tokens are single use; the resumed connection gets a new one
+        session = self.sessions.pop(token, None)
+        if session is None or (session.expires is not None and session.expires < monotonic()):
+            return None
+        return session.user
+
+    def expire_sessions(self, now: float) -> None:
+        for token in [t for t, s in self.sessions.items() if s.expires is not None and s.expires < now]:
+            del self.sessions[token]
+
+    def events_since(self, seq: int) -> Optional[list[Frame]]:
+        '''Frames of the events after `seq`, latest per property; None if they are no longer buffered.'''
+        if seq > self.seq:
+            # From before a restart, or another worker
+            return None
+        if seq == self.seq:
+            return []
+        if not self.events or self.events[0][0] > seq + 1:
+            return None
+        missed: dict[Any, Frame] = {}
+        for event_seq, key, frame in self.events:
+            if event_seq <= seq:
+                continue
+            if key is None:
+                key = event_seq
+            else:
+                missed.pop(key, None)
+            missed[key] = frame
+        return list(missed.values())
+
+    def _on_outbound_drop(self, outbound: MemberOutbound, reason: str) -> None:
+        logger.warning(f"Dropping {outbound.user_id} from room {self.uuid}: {reason}")
+        # The member may already have reconnected with a new socket
+        if self.outbound.get(outbound.user_id) is outbound:
+            self.remove_connected_socket(outbound.user_id)
+
+    async def close(self, reason: str = "Room closed") -> None:
+        if self.status is RoomStatus.CLOSED:
+            return
+        sockets = list(self.connected_users.values())
+        for user_id in list(self.connected_users):
+            self.remove_connected_socket(user_id)
+        for sync in self.clock_syncs.values():
+            sync.stop()
+        self.clock_syncs.clear()
+        self.sessions.clear()
+        self.status = RoomStatus.CLOSED
+        self.status_since = monotonic()
+        await asyncio.gather(*(self._close_socket(socket, reason) for socket in sockets))
+
+    @staticmethod
+    async def _close_socket(socket: WebSocket, reason: str) -> None:
+        try:
+            await asyncio.wait_for(socket.close(code=4010, reason=reason), settings.broadcast_send_timeout)
+        except Exception:
+            pass
 
-    async def close(self):
-        ...
+    def to_server_time(self, user_id: int, ts: float) -> float:
+        sync = self.clock_syncs.get(user_id)
+        if sync is None:
+            return ts
+        return sync.to_server_time(ts)
 
-    async def recv_master(self, message: dict):
-        message_w = MessageWrap(message)
-        if message_w.command == "desc":
-            self.description.update(message_w)
+    async def recv_master(self, message: Union[Message, dict, str, bytes]):
+        # Raises MessageError for malformed frames
+        if not isinstance(message, Message):
+            message = decode_message(message)
+        self._messages[0] += 1
+        # Master timestamps (and so the anchor of every seek target) move onto the server clock
+        if message.timestamp is not None:
+            message.timestamp = self.to_server_time(self.master.id, message.timestamp)
+        for item in message.items or ():
+            if item.timestamp is not None:
+                item.timestamp = self.to_server_time(self.master.id, item.timestamp)
+        await self._apply_master(message)
+        if self.backplane is not None:
+            self.backplane.publish(self.topic, message.to_dict())
+        # Only the owner has a store; replicas leave persisting to it through recv_remote
+        self._changed()
+
+    async def recv_remote(self, payload: dict):
+        if "presence" in payload:
+            self._on_presence(payload)
+            return
+        # A master message relayed from another worker, already on the server clock
+        await self._apply_master(decode_message(payload))
+        self._changed()
+
+    async def _apply_master(self, message: Message):
+        self.last_activity = monotonic()
+        if message.command == "desc":
+            self._apply_desc(message)
+        elif message.command in ("state", "action"):
+            if self.state.update(message):
+                await self.notify_all_users(message)
+        elif message.command == "batch":
+            updates = [item for item in message.items if item.command != "desc"]
+            # Validated before the description changes too, so a bad batch leaves everything as it was
+            if not self.state.validate_batch(updates):
+                return
+            for item in message.items:
+                if item.command == "desc":
+                    self._apply_desc(item)
+            changed = self.state.update_batch(updates)
+            if len(changed) > 1:
+                await self.notify_all_users(Message("batch", items=changed))
+            elif changed:
+                await self.notify_all_users(changed[0])
         else:
-            if self.state.update(message_w):
-                await self.notify_all_users(message_w)
+            logger.warning(
+                f"Invalid received message with unexpected command from master: {message.command}",
+                extra={"source": self.uuid}
+            )
     
-    async def recv_member(self, user_id: int, message: dict):
-        message_w = MessageWrap(message)
-        if message_w.command == "req":
-            if message_w.name == "desc":
-                extra = self.description.to_dict()
-            elif message_w.name == "state":
-                extra = self.state.to_dict()
+    def _apply_desc(self, message: Message) -> None:
+        self.description.update(message)
+        self.state.clock.duration = or_none(self.description.duration)
+        # Members fetch the description with `req desc`, so it is not broadcast; it is
+        # still numbered into the ring so a resuming member learns about a new file
+        self.seq += 1
+        self.events.append((self.seq, ("desc",), self.description.snapshot()))
+
+    async def _sync_ticker(self, interval: float) -> None:
+        # Members extrapolate between ticks, so the master does not need to stream `pos`
+        while True:
+            await asyncio.sleep(interval)
+            if not self.state.clock.running:
+                continue
+            now = get_system_time()
+            await self.notify_all_users(Message(
+                "state", "pos", self.state.position_at(now), now,
+                {"tick": True, "timestamp_server": now}
+            ))
+    
+    async def recv_member(self, user_id: int, message: Union[Message, dict, str, bytes]):
+        # Raises MessageError for malformed frames
+        if not isinstance(message, Message):
+            message = decode_message(message)
+        if message.command == "req":
+            if message.name == "desc":
+                snapshot = self.description.snapshot()
+            elif message.name == "state":
+                snapshot = self.state.snapshot()
             else:
-                logger.warning(f"Invalid received message with unknown req name: {message_w.name} from {user_id}")
+                logger.warning(
+                    f"Invalid received message with unknown req name: {message.name} from {user_id}",
+                    extra={"source": user_id}
+                )
                 return
-            await self.send_to(user_id, {"command": "req", "extra": extra})
-        elif message_w.command == "state":
+            await self.send_to(user_id, snapshot)
+        elif message.command == "state":
             pass
         else:
-            logger.warning(f"Invalid received message with unknown command: {message_w.command} from {user_id}")
+            logger.warning(
+                f"Invalid received message with unknown command: {message.command} from {user_id}",
+                extra={"source": user_id}
+            )
 
     @staticmethod
-    def pack_message(message: MessageWrap):
-        return dumps({
+    def pack_message(message: Message, seq: Optional[int] = None) -> Frame:
+        # Encoded once per message, then shared by notify_all_users and send_to
+        if message.frame is not None:
+            return message.frame.reuse()
+        if message.items is not None:
+            message.frame = Frame.batch([Room.pack_message(item) for item in message.items])
+            return message.frame
+        payload = {
             "command": message.command,
             "name": message.name.replace("-", "_"),
             "value": message.value,
-            "extra": message.extra.to_dict()
-        })
-
-    async def send_to(self, user_id: int, message: Union[dict, MessageWrap]) -> None:
-        socket = self.connected_users.get(user_id)
-        if socket is not None:
-            if isinstance(message, MessageWrap):
-                await socket.send_text(self.pack_message(message))
-            else:
-                await socket.send_json(message)
+            "timestamp": message.timestamp,
+            "extra": {} if message.extra is None else message.extra
+        }
+        if seq is not None:
+            payload["seq"] = seq
+        message.frame = Frame.encode(payload)
+        return message.frame
+
+    def _sequence(self, message: Message) -> Frame:
+        # Numbers a broadcast event and keeps it for resuming members; batch items get a seq each
+        if message.items is not None:
+            message.frame = Frame.batch([self._sequence(item) for item in message.items])
+            return message.frame
+        self.seq += 1
+        message.frame = None
+        frame = self.pack_message(message, self.seq)
+        self.events.append((self.seq, self.coalesce_key(message), frame))
+        return frame
+
+    @staticmethod
+    def coalesce_key(message: Message):
+        # Superseded property updates collapse in member queues, latest wins
+        if message.command == "state" or (message.command == "action" and message.name == "seek"):
+            return (message.command, message.name)
+        return None
+
+    async def send_to(self, user_id: int, message: Union[dict, Message, Frame]) -> None:
+        outbound = self.outbound.get(user_id)
+        if outbound is not None:
+            if isinstance(message, Message):
+                message = self.pack_message(message)
+            elif not isinstance(message, Frame):
+                message = Frame.encode(message)
+            outbound.put(message)
+            direct_sends.inc()
     
-    async def notify_all_users(self, message: MessageWrap) -> None:
-        for socket in self.connected_users.values():
-            # logger.info(f"Sending message to {socket.client.host}")
-            await socket.send_text(self.pack_message(message))
+    async def send_now(self, user_id: int, frame: Frame) -> None:
+        outbound = self.outbound.get(user_id)
+        if outbound is not None:
+            await outbound.send_now(frame)
+            direct_sends.inc()
+
+    async def notify_all_users(self, message: Message) -> None:
+        frame = self._sequence(message)
+        if not self.outbound:
+            return
+        key = self.coalesce_key(message)
+        outbounds = list(self.outbound.values())
+        frame.reuse(len(outbounds) - 1)
+        for outbound in outbounds:
+            outbound.put(frame, key)
+
+ROOMS_TOPIC = "rooms"
 
 class RoomManager:
     def __init__(self) -> None:
-        self.rooms = {}
+        self.rooms: dict[str, Room] = {}
+        self.backplane: Optional[Backplane] = None
+        self.store: Optional["RoomStore"] = None
+        self._reaper_task: Optional[asyncio.Task] = None
+
+    def start_reaper(self, interval: Optional[float] = None) -> None:
+        interval = settings.room_reap_interval if interval is None else interval
+        if self._reaper_task is None and interval > 0:
+            self._reaper_task = asyncio.create_task(self._reaper(interval))
+
+    def stop_reaper(self) -> None:
+        if self._reaper_task is not None:
+            self._reaper_task.cancel()
+            self._reaper_task = None
+
+    async def _reaper(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            now = monotonic()
+            for room in self.rooms.values():
+                room.expire_sessions(now)
+                if room.connected_users or room.master_connected:
+                    room.announce_presence()
+            for room in [room for room in self.rooms.values() if room.expired(now)]:
+                logger.info(f"Reaping room {room.uuid} ({room.status.value})")
+                try:
+                    await self.close_room(room.uuid, "Room closed after inactivity")
+                except Exception as e:
+                    logger.exception(f"Failed to reap room {room.uuid}: {e}")
+
+    async def attach_store(self, store: "RoomStore") -> None:
+        # Restore persisted rooms so clients can reconnect to the same uuids
+        self.store = store
+        await store.start()
+        for model in await store.load_all():
+            room = self.rooms.get(model.uuid)
+            if room is None:
+                room = Room(User(model.master_id, model.master_name, ""), model.name, uuid=model.uuid)
+                room.members = {user_id: User(user_id, name, "") for user_id, name in loads(model.members)}
+                self.rooms[room.uuid] = room
+                if self.backplane is not None:
+                    self._share(room)
+            store.load_into(room, model)
+            room.state.clock.duration = or_none(room.description.duration)
+        for room in self.rooms.values():
+            room.store = store
+            store.mark_dirty(room)
+        logger.info(f"Restored {len(self.rooms)} rooms")
 
-    def create_room(self, master: User, name: str = "New Room") -> Room:
-        room = Room(master, name)
+    async def attach_backplane(self, backplane: Backplane) -> None:
+        # Rooms are announced on ROOMS_TOPIC; every worker keeps a replica of each
+        # room and relays master messages through the room's own topic
+        self.backplane = backplane
+        await backplane.start(self._on_backplane)
+        backplane.subscribe(ROOMS_TOPIC)
+        for room in self.rooms.values():
+            self._share(room)
+
+    def _share(self, room: Room) -> None:
+        room.backplane = self.backplane
+        self.backplane.subscribe(room.topic)
+        self._announce(room)
+
+    def _announce(self, room: Room) -> None:
+        self.backplane.publish(ROOMS_TOPIC, {**room.info(), "owner": self.backplane.worker_id}, retain=room.uuid)
+
+    def _demote(self, room: Room) -> None:
+        # Another worker owns the room: keep it as a replica, and leave persisting and reaping to the owner
+        room.replica = True
+        if room.store is not None:
+            room.store.discard(room.uuid)
+            room.store = None
+
+    async def _on_backplane(self, topic: str, payload: dict) -> None:
+        if topic == ROOMS_TOPIC:
+            uuid = payload["uuid"]
+            if payload.get("deleted"):
+                if (room := self._forget_room(uuid)) is not None:
+                    await room.close()
+            elif (room := self.rooms.get(uuid)) is not None:
+                owner = payload.get("owner")
+                if room.replica or owner is None or owner == self.backplane.worker_id:
+                    return
+                # Every worker restores persisted rooms at startup; the lowest worker id keeps each one
+                if owner < self.backplane.worker_id:
+                    self._demote(room)
+                else:
+                    # Take the retained announcement back from the worker that gives way
+                    self._announce(room)
+            else:
+                master = User(payload["master"]["id"], payload["master"]["name"], "")
+                room = Room(master, payload["name"], uuid=uuid)
+                room.replica = True
+                room.backplane = self.backplane
+                self.rooms[uuid] = room
+                self.backplane.subscribe(room.topic)
+            return
+        room = self.rooms.get(topic.removeprefix("room:"))
+        if room is not None:
+            await room.recv_remote(payload)
+
+    def create_room(self, master: User, name: str = "New Room", uuid: Optional[str] = None) -> Room:
+        room = Room(master, name, uuid)
         self.rooms[room.uuid] = room
+        if self.backplane is not None:
+            self._share(room)
+        if self.store is not None:
+            room.store = self.store
+            self.store.mark_dirty(room)
         return room
 
-    def get_room(self, uuid: str) -> Room:
-        return self.rooms[uuid]
+    def get_room(self, uuid: str) -> Optional[Room]:
+        return self.rooms.get(uuid)
+
+    def _forget_room(self, uuid: str) -> Optional[Room]:
+        room = self.rooms.pop(uuid, None)
+        room_messages.remove(uuid)
+        if room is not None and self.backplane is not None:
+            self.backplane.unsubscribe(room.topic)
+        return room
+
+    async def close_room(self, uuid: str, reason: str = "Room closed") -> None:
+        room = self.rooms.get(uuid)
+        if room is not None:
+            await room.close(reason)
+            self.delete_room(uuid)
 
     def delete_room(self, uuid: str) -> None:
-        del self.rooms[uuid]
+        if self.store is not None:
+            self.store.mark_deleted(uuid)
+        if self._forget_room(uuid) is not None and self.backplane is not None:
+            self.backplane.publish(ROOMS_TOPIC, None, retain=uuid)
+            self.backplane.publish(ROOMS_TOPIC, {"uuid": uuid, "deleted": True})
 
 _g_group_manager = RoomManager()
 
+def _collect_rooms():
+    counts = dict.fromkeys(RoomStatus, 0)
+    for room in _g_group_manager.rooms.values():
+        counts[room.status] += 1
+    return [((status.value,), count) for status, count in counts.items()]
+
+def _collect_queue_depth():
+    depths = [len(o) for room in _g_group_manager.rooms.values() for o in room.outbound.values()]
+    return [(("sum",), sum(depths)), (("max",), max(depths, default=0))]
+
+registry.register(Gauge("mpv_sync_rooms", "Rooms by status", _collect_rooms, ("status",)))
+registry.register(Gauge(
+    "mpv_sync_room_members", "Member sockets connected to rooms",
+    lambda: [((), sum(len(room.outbound) for room in _g_group_manager.rooms.values()))]
+))
+registry.register(Gauge(
+    "mpv_sync_outbound_queue_depth", "Frames waiting in member outbound queues",
+    _collect_queue_depth, ("stat",)
+))
+
 def get_room_manager() -> RoomManager:
     return _g_group_manager
 
@@ -0,0 +1,125 @@
+import asyncio
+from typing import Awaitable, Callable, Optional
+from src.config import settings
+from src.log import logger
+from .frame import Frame
+from .message import Message
+
+
+class ClockSync:
+    '''NTP-style clock offset and RTT estimate for one WebSocket client.
+
+    The server sends `{"command": "ping", "extra": {"t0": ...}}`. The client
+    answers `{"command": "pong", "extra": {"t0": ..., "t1": ..., "t2": ...}}`,
+    where t1 and t2 are its own clock when the ping arrived and when the pong
+    left. With t3 the server clock on arrival:
+
+        offset = ((t1 - t0) + (t2 - t3)) / 2    client clock minus server clock
+        rtt    = (t3 - t0) - (t2 - t1)
+
+    Both are smoothed, and samples whose RTT is far above the running
+    estimate are discarded since their offset is unreliable, unless several
+    arrive in a row, which means the link itself changed. After each
+    accepted sample the client is told its estimate with a `timesync` message.
+    '''
+    OFFSET_GAIN = 0.25
+    RTT_GAIN = 0.125
+    OUTLIER_FACTOR = 3.0
+    OUTLIER_MIN_RTT = 0.02
+    MAX_CONSECUTIVE_REJECTS = 3
+    WARMUP_PINGS = 4
+
+    def __init__(
+        self,
+        send: Callable[[Frame], Awaitable[None]],
+        clock: Callable[[], float],
+        interval: Optional[float] = None,
+    ):
+        self._send = send
+        self._clock = clock
+        self.interval = settings.timesync_interval if interval is None else interval
+        self.offset: Optional[float] = None
+        self.rtt: Optional[float] = None
+        self.samples = 0
+        self.rejected = 0
+        self._rejected_in_row = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def synced(self) -> bool:
+        return self.offset is not None
+
+    def to_server_time(self, client_ts: float) -> float:
+        if self.offset is None:
+            return client_ts
+        return client_ts - self.offset
+
+    def to_client_time(self, server_ts: float) -> float:
+        if self.offset is None:
+            return server_ts
+        return server_ts + self.offset
+
+    def start(self) -> None:
+        if self.interval > 0:
+            self._task = asyncio.create_task(self._pinger())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _send_frame(self, payload: dict) -> None:
+        await self._send(Frame.encode(payload))
+
+    async def _pinger(self) -> None:
+        sent = 0
+        try:
+            while True:
+                await self._send_frame({"command": "ping", "extra": {"t0": self._clock()}})
+                sent += 1
+                # A quick burst first so the estimate settles soon after connecting
+                await asyncio.sleep(min(1.0, self.interval) if sent < self.WARMUP_PINGS else self.interval)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Stopped clock sync pings: {e}")
+
+    def sample(self, t0: float, t1: float, t2: float, t3: float) -> bool:
+        rtt = max((t3 - t0) - (t2 - t1), 0.0)
+        offset = ((t1 - t0) + (t2 - t3)) / 2
+        if (
+            self.rtt is not None
+            and rtt > max(self.rtt * self.OUTLIER_FACTOR, self.OUTLIER_MIN_RTT)
+            and self._rejected_in_row < self.MAX_CONSECUTIVE_REJECTS
+        ):
+            self.rejected += 1
+            self._rejected_in_row += 1
+            return False
+        self._rejected_in_row = 0
+        if self.offset is None:
+            self.offset, self.rtt = offset, rtt
+        else:
+            self.offset += (offset - self.offset) * self.OFFSET_GAIN
+            self.rtt += (rtt - self.rtt) * self.RTT_GAIN
+        self.samples += 1
+        return True
+
+    async def on_message(self, message: Message) -> bool:
+        '''Consume a pong; returns False for any other message.'''
+        if message.command != "pong":
+            return False
+        t3 = self._clock()
+        extra = message.extra
+        try:
+            t0 = float(extra["t0"])
+            t1 = float(extra["t1"])
+            t2 = float(extra.get("t2", t1))
+        except (TypeError, KeyError, ValueError):
+            logger.warning(f"Invalid pong message: {message}")
+            return True
+        if self.sample(t0, t1, t2, t3):
+            await self._send_frame({
+                "command": "timesync",
+                "extra": {"offset": self.offset, "rtt": self.rtt}
+            })
+        return True
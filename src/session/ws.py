@@ -1,21 +1,76 @@
-from fastapi import APIRouter, WebSocket
+import asyncio
+from typing import Awaitable, Callable, Optional
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 from fastapi.websockets import WebSocketState
 from src.jwt import JWTError, verify_token
 from src.user import User, get_user_by_name
 from src.log import logger
+from src.metrics import Gauge, registry
 
-from .room import get_room_manager
+from .room import get_room_manager, get_system_time
+from .timesync import ClockSync
+from .ingress import IngressLimiter, IngressLimitExceeded
+from .frame import Frame
+from .message import Message, MessageError, decode_message
 
 router = APIRouter(prefix="/ws")
 
 connected_clients = set()
+registry.register(Gauge(
+    "mpv_sync_connected_clients", "Open WebSocket connections", lambda: [((), len(connected_clients))]
+))
 
 g_room_manager = get_room_manager()
 
+def locked_sender(websocket: WebSocket) -> Callable[[Frame], Awaitable[None]]:
+    # For sockets without an outbound queue, where pings and error replies may overlap
+    lock = asyncio.Lock()
+    async def send(frame: Frame):
+        async with lock:
+            await websocket.send_text(frame.text)
+    return send
+
+def resume_params(websocket: WebSocket) -> tuple[Optional[str], Optional[int]]:
+    # A reconnecting member passes its session token and the last seq it saw
+    token = websocket.query_params.get("resume")
+    try:
+        seq = int(websocket.query_params["seq"])
+    except (KeyError, ValueError):
+        seq = None
+    return token, seq
+
+async def receive_message(
+    websocket: WebSocket,
+    reply: Callable[[Frame], Awaitable[None]],
+    limiter: Optional[IngressLimiter] = None,
+) -> Optional[Message]:
+    '''Receive and decode one frame; malformed frames are answered with an error and give None.
+
+    With a `limiter`, malformed frames are charged to it first and only
+    answered and logged while within the limit.
+    '''
+    raw = await websocket.receive()
+    if raw["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(raw.get("code", 1000), raw.get("reason"))
+    data = raw.get("text")
+    if data is None:
+        data = raw.get("bytes")
+    try:
+        return decode_message(data)
+    except MessageError as e:
+        if limiter is not None and not limiter.charge("invalid"):
+            return None
+        logger.warning(f"Rejected message from {websocket.client}: {e}", extra={"source": websocket.client})
+        await reply(Frame.encode({"command": "error", "extra": e.to_dict()}))
+        return None
+
 
 @router.websocket("/master/{room_id}")
 async def websocket_endpoint_master(websocket: WebSocket, room_id: str):
     accepted = False
+    room = None
+    sync = None
+    limiter = None
     try:
         decode = verify_token(websocket.headers.get("Authorization"))
     except JWTError:
@@ -33,31 +88,61 @@ async def websocket_endpoint_master(websocket: WebSocket, room_id: str):
             await websocket.close(code=4004, reason="Room not found")
             return
         room.add_member(user)
+        room.attach_master()
+        send = locked_sender(websocket)
+        sync = ClockSync(send, get_system_time)
+        room.clock_syncs[user.id] = sync
+        sync.start()
+        limiter = IngressLimiter(room.recv_master)
         
         while True:
-            data = await websocket.receive_json()
-            room.recv_master(data)
+            message = await receive_message(websocket, send, limiter)
+            if message is None or (message.command == "pong" and not limiter.charge("pong")):
+                continue
+            if await sync.on_message(message):
+                continue
+            if not await limiter.submit(message):
+                await websocket.close(code=1008, reason="Rate limit exceeded")
+                return
+    except IngressLimitExceeded:
+        await websocket.close(code=1008, reason="Rate limit exceeded")
     except Exception as e:
         if websocket.client_state != WebSocketState.DISCONNECTED:
             await websocket.close(code=1002, reason=f"Closed by server with err: {e}")
     finally:
+        if limiter is not None:
+            limiter.stop()
+        if sync is not None:
+            sync.stop()
+            if room.clock_syncs.get(user.id) is sync:
+                del room.clock_syncs[user.id]
         if accepted:
             connected_clients.remove(websocket)
-            room.remove_member(user)
-            await room.close()
+            if room is not None:
+                room.detach_master()
 
 @router.websocket("/member/{room_id}")
 async def websocket_endpoint_member(websocket: WebSocket, room_id: str):
     accepted = False
-    try:
-        decode = verify_token(websocket.headers.get("Authorization"))
-    except JWTError:
-        await websocket.close(code=4001, reason="Unauthorized token expired")
-        return
-    if decode is None:
-        await websocket.close(code=4001, reason="Unauthorized")
-        return
-    user = await get_user_by_name(decode.get("sub"))
+    room = None
+    sync = None
+    session = None
+    resume_token, resume_seq = resume_params(websocket)
+    # A valid resume token stands in for the JWT check and the user lookup
+    user = None
+    if resume_token is not None and (room := g_room_manager.get_room(room_id)) is not None:
+        user = room.resume_session(resume_token)
+    if user is None:
+        resume_seq = None
+        try:
+            decode = verify_token(websocket.headers.get("Authorization"))
+        except JWTError:
+            await websocket.close(code=4001, reason="Unauthorized token expired")
+            return
+        if decode is None:
+            await websocket.close(code=4001, reason="Unauthorized")
+            return
+        user = await get_user_by_name(decode.get("sub"))
     try:
         await websocket.accept()
         accepted = True
@@ -65,24 +150,39 @@ async def websocket_endpoint_member(websocket: WebSocket, room_id: str):
         if (room := g_room_manager.get_room(room_id)) is None:
             await websocket.close(code=4004, reason="Room not found")
             return
-        room.add_member(user)
-        room.add_connected_socket(user.id, websocket)
+        session = room.connect_member(user, websocket, resume_seq)
+        send = lambda frame: room.send_to(user.id, frame)
+        # Pings skip the outbound queue, or time spent queued would skew the offset
+        sync = ClockSync(lambda frame: room.send_now(user.id, frame), get_system_time)
+        room.clock_syncs[user.id] = sync
+        sync.start()
         while True:
-            data = await websocket.receive_json()
-            await room.recv_member(data)
+            message = await receive_message(websocket, send)
+            if message is None or await sync.on_message(message):
+                continue
+            await room.recv_member(user.id, message)
     except Exception as e:
         logger.error(f"Error in websocket_endpoint_member: {e}")
         if websocket.client_state != WebSocketState.DISCONNECTED:
             await websocket.close(code=1002, reason=f"Closed by server with err: {e}")
     finally:
+        if session is not None:
+            room.suspend_session(session)
+        if sync is not None:
+            sync.stop()
+            if room.clock_syncs.get(user.id) is sync:
+                del room.clock_syncs[user.id]
         if accepted:
             connected_clients.remove(websocket)
-            room.remove_member(user)
-            room.remove_connected_socket(user.id)
+            if room is not None and room.remove_connected_socket(user.id, websocket):
+                room.remove_member(user)
 
 test_mas_user = User(1001, "TEST_MASTER", "xxx")
 mas_connected = False
-test_room = g_room_manager.create_room(test_mas_user, "TEST_ROOM")
+# Fixed uuid so that every worker shares the same test room over the backplane
+TEST_ROOM_UUID = "00000000-0000-0000-0000-000000000000"
+test_room = g_room_manager.create_room(test_mas_user, "TEST_ROOM", uuid=TEST_ROOM_UUID)
+test_room.keep_alive = True
 test_mem_id_start = 1002
 
 # Test endpoints
@@ -97,19 +197,38 @@ async def websocket_endpoint_test_master(websocket: WebSocket):
     await websocket.accept()
     accepted = True
     mas_connected = True
+    test_room.attach_master()
     connected_clients.add(websocket)
+    send = locked_sender(websocket)
+    sync = ClockSync(send, get_system_time)
+    test_room.clock_syncs[test_mas_user.id] = sync
+    sync.start()
+    limiter = IngressLimiter(test_room.recv_master)
     try:
         while True:
-            data = await websocket.receive_json()
-            await test_room.recv_master(data)
-            # logger.info(f"Received data from {test_mas_user.name}: {data}")
+            message = await receive_message(websocket, send, limiter)
+            if message is None or (message.command == "pong" and not limiter.charge("pong")):
+                continue
+            if await sync.on_message(message):
+                continue
+            # logger.info(f"Received data from {test_mas_user.name}: {message}")
+            if not await limiter.submit(message):
+                await websocket.close(code=1008, reason="Rate limit exceeded")
+                return
+    except IngressLimitExceeded:
+        await websocket.close(code=1008, reason="Rate limit exceeded")
     except Exception as e:
         logger.error(f"Error in websocket_endpoint_test_master: {e}")
         if websocket.client_state != WebSocketState.DISCONNECTED:
             await websocket.close(code=1002, reason=f"Closed by server with err: {e}")
     finally:
+        limiter.stop()
+        sync.stop()
+        if test_room.clock_syncs.get(test_mas_user.id) is sync:
+            del test_room.clock_syncs[test_mas_user.id]
         if accepted:
             mas_connected = False
+            test_room.detach_master()
             connected_clients.remove(websocket)
 
 @router.websocket("/test_member")
@@ -117,25 +236,38 @@ async def websocket_endpoint_test_member(websocket: WebSocket):
     global test_mem_id_start
     accepted = False
     await websocket.accept()
-    _id = test_mem_id_start
-    test_mem_id_start += 1
+    resume_token, resume_seq = resume_params(websocket)
+    test_mem_user = None if resume_token is None else test_room.resume_session(resume_token)
+    if test_mem_user is None:
+        resume_seq = None
+        _id = test_mem_id_start
+        test_mem_id_start += 1
+        test_mem_user = User(_id, f"TEST_MEMBER_{_id}", "xxx")
     accepted = True
-    test_mem_user = User(_id, f"TEST_MEMBER_{_id}", "xxx")
     connected_clients.add(websocket)
-    test_room.add_member(test_mem_user)
-    test_room.add_connected_socket(test_mem_user.id, websocket)
+    session = test_room.connect_member(test_mem_user, websocket, resume_seq)
+    send = lambda frame: test_room.send_to(test_mem_user.id, frame)
+    sync = ClockSync(lambda frame: test_room.send_now(test_mem_user.id, frame), get_system_time)
+    test_room.clock_syncs[test_mem_user.id] = sync
+    sync.start()
     try:
         while True:
-            data = await websocket.receive_json()
-            # logger.info(f"Received data from {test_mem_user.name}: {data}")
-            await test_room.recv_member(test_mem_user.id, data)
+            message = await receive_message(websocket, send)
+            if message is None or await sync.on_message(message):
+                continue
+            # logger.info(f"Received data from {test_mem_user.name}: {message}")
+            await test_room.recv_member(test_mem_user.id, message)
     except Exception as e:
         logger.exception(f"Error in websocket_endpoint_test_member: {e}")
         if websocket.client_state != WebSocketState.DISCONNECTED:
             await websocket.close(code=1002, reason=f"Closed by server with err: {e}")
     finally:
+        test_room.suspend_session(session)
+        sync.stop()
+        if test_room.clock_syncs.get(test_mem_user.id) is sync:
+            del test_room.clock_syncs[test_mem_user.id]
         if accepted:
             logger.info(f"Remove {test_mem_user.name} from room {test_room.uuid}")
             connected_clients.remove(websocket)
-            test_room.remove_member(test_mem_user)
-            test_room.remove_connected_socket(test_mem_user.id)
+            if test_room.remove_connected_socket(test_mem_user.id, websocket):
+                test_room.remove_member(test_mem_user)
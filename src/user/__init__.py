@@ -1,10 +1,16 @@
-from .user import User, get_user_by_name, create_user, UserException, UserAlreadyExists
+from .user import (
+    User, get_user_by_name, get_user_by_id, create_user, invalidate_user, user_cache_stats,
+    UserException, UserAlreadyExists
+)
 
 __all__ = [
     "User", 
     "get_user_by_name", 
+    "get_user_by_id", 
     "create_user", 
+    "invalidate_user", 
+    "user_cache_stats", 
     "UserException", 
     "UserAlreadyExists"
     
-]
\ No newline at end of file
+]
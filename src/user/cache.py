@@ -0,0 +1,97 @@
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass
+from time import monotonic
+from typing import Awaitable, Callable, Generic, Hashable, Optional, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    invalidations: int = 0
+
+
+class TTLCache(Generic[K, V]):
+    '''Bounded LRU mapping whose entries also expire `ttl` seconds after insertion.'''
+    def __init__(self, maxsize: int, ttl: float, stats: Optional[CacheStats] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stats = CacheStats() if stats is None else stats
+        self._data: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        # Concurrent misses for one key share a single load
+        self._loading: dict[K, asyncio.Future] = {}
+        # Bumped by every invalidation, so a load that raced with one is not cached
+        self._generation = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key: K) -> Optional[V]:
+        entry = self._data.get(key)
+        if entry is None:
+            self.stats.misses += 1
+            return None
+        expires, value = entry
+        if expires < monotonic():
+            del self._data[key]
+            self.stats.expirations += 1
+            self.stats.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.stats.hits += 1
+        return value
+
+    def put(self, key: K, value: V) -> None:
+        if self.maxsize <= 0:
+            return
+        self._data[key] = (monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.stats.evictions += 1
+
+    def pop(self, key: K) -> Optional[V]:
+        self._generation += 1
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return None
+        self.stats.invalidations += 1
+        return entry[1]
+
+    def clear(self) -> None:
+        self._generation += 1
+        self._data.clear()
+
+    async def get_or_load(self, key: K, load: Callable[[], Awaitable[Optional[V]]]) -> Optional[V]:
+        value = self.get(key)
+        if value is not None:
+            return value
+        future = self._loading.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+        future = asyncio.get_running_loop().create_future()
+        self._loading[key] = future
+        generation = self._generation
+        try:
+            value = await load()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Nobody may be waiting; do not warn about an unretrieved exception
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+        finally:
+            del self._loading[key]
+        if value is not None and generation == self._generation:
+            self.put(key, value)
+        return value
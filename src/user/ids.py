@@ -0,0 +1,39 @@
+import asyncio
+from typing import Optional
+from src import prog
+from src.config import settings
+
+USER_ID_BASE = 1000_000_000
+
+
+class UserIDAllocator:
+    '''Hands out user ids from blocks reserved in the database (hi/lo).
+
+    One commit reserves `block_size` ids; registrations then take ids from
+    memory. Ids left in a block when the process exits are skipped, never
+    reused, so ids stay unique across restarts and workers but may have gaps.
+    '''
+    def __init__(self, block_size: Optional[int] = None):
+        self.block_size = settings.user_id_block_size if block_size is None else block_size
+        self._next = 0
+        self._end = 0
+        self._lock = asyncio.Lock()
+        self.reservations = 0
+
+    async def _reserve(self) -> None:
+        async with prog.program.session_context() as session:
+            start = await session.user_id.reserve(self.block_size)
+        self._next, self._end = start, start + self.block_size
+        self.reservations += 1
+
+    async def next_id(self) -> int:
+        if self._next >= self._end:
+            async with self._lock:
+                if self._next >= self._end:
+                    await self._reserve()
+        raw = self._next
+        self._next += 1
+        return raw + USER_ID_BASE if raw < USER_ID_BASE else raw
+
+
+user_ids = UserIDAllocator()
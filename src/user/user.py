@@ -1,8 +1,13 @@
 from dataclasses import dataclass
 from typing import Optional
-from src.database import UserModel, UserIDModel, Session
-from src.prog import program
+from sqlalchemy.exc import IntegrityError
+from src.database import UserModel
+from src import prog
+from src.config import settings
 from src.jwt import get_password_hash
+from src.metrics import registry, stats_gauge
+from .cache import CacheStats, TTLCache
+from .ids import user_ids
 
 class UserException(Exception):
     '''Base class for user exceptions'''
@@ -32,54 +37,60 @@ class User:
     def __eq__(self, other):
         return self.id == other.id
 
-USER_ID_BASE = 1000_000_000
-
-async def generate_user_id(session: Session):
-    user_id_e = await session.user_id.get_by(unique=True, id=0)
-    if user_id_e is None:
-        user_id_m = UserIDModel(
-            id=0,
-            latest_id=0
-        )
-    else:
-        user_id_m = user_id_e.sqlmodel_update(latest_id=user_id_e.latest_id + 1)
-    
-    session.add(user_id_m)
-    await session.commit()
-    user_id_raw = user_id_m.latest_id
-    if user_id_raw < USER_ID_BASE:
-        user_id = user_id_raw + USER_ID_BASE
-    else:
-        user_id = user_id_raw
-    return user_id
+# Keeps the database out of the WebSocket handshake path during reconnect storms
+user_cache_stats = CacheStats()
+_users_by_name: TTLCache[str, User] = TTLCache(settings.user_cache_size, settings.user_cache_ttl, user_cache_stats)
+_users_by_id: TTLCache[int, User] = TTLCache(settings.user_cache_size, settings.user_cache_ttl, user_cache_stats)
+registry.register(stats_gauge("mpv_sync_user_cache", "User lookup cache hits, misses and removals", user_cache_stats))
 
+def invalidate_user(name: Optional[str] = None, user_id: Optional[int] = None) -> None:
+    '''Drop a user from the lookup cache; call after any change to the user row.'''
+    for user in (
+        _users_by_name.pop(name) if name is not None else None,
+        _users_by_id.pop(user_id) if user_id is not None else None,
+    ):
+        if user is not None:
+            _users_by_name.pop(user.name)
+            _users_by_id.pop(user.id)
 
 async def create_user(name: str, password: str):
-    async with program.session_context() as session:
-        user = session.user.get_by(name=name)
+    async with prog.program.session_context() as session:
+        user = await session.user.get_by(username=name)
         if user is not None:
             raise UserAlreadyExists(f"User {name} already exists")
-        user_id = await generate_user_id(session)
+        user_id = await user_ids.next_id()
         user = UserModel(
-            name=name, 
-            password_hash=get_password_hash(password),
+            username=name, 
+            password_hash=await get_password_hash(password),
+            hash_algorithm="bcrypt",
+            salt="",
             user_id=user_id
         )
         session.add(user)
-        await session.commit()
+        try:
+            await session.commit()
+        except IntegrityError:
+            # A concurrent registration of the same name won the unique index
+            await session.rollback()
+            raise UserAlreadyExists(f"User {name} already exists") from None
+        invalidate_user(name, user_id)
         return User.from_model(user)
 
-async def get_user_by_name(name: str) -> Optional[User]:
-    async with program.session_context() as session:
-        user = session.user.get_by(name=name)
+async def _load_user(**filters) -> Optional[User]:
+    async with prog.program.session_context() as session:
+        user = await session.user.get_by(**filters)
         if user is None:
             return None
         return User.from_model(user)
 
-async def get_user_by_id(user_id: int) -> Optional[User]:
-    async with program.session_context() as session:
-        user = session.user.get_by(user_id=user_id)
-        if user is None:
-            return None
-        return User.from_model(user)
+async def get_user_by_name(name: str) -> Optional[User]:
+    user = await _users_by_name.get_or_load(name, lambda: _load_user(username=name))
+    if user is not None:
+        _users_by_id.put(user.id, user)
+    return user
 
+async def get_user_by_id(user_id: int) -> Optional[User]:
+    user = await _users_by_id.get_or_load(user_id, lambda: _load_user(user_id=user_id))
+    if user is not None:
+        _users_by_name.put(user.name, user)
+    return user